@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from utils.metrics.closeness import ClosenessReference, t_closeness_distances
+
+
+def random_groups(rng):
+    n = int(rng.integers(2, 200))
+    values = rng.integers(0, int(rng.integers(2, 30)), n).astype(np.float64)
+    group_ids = rng.integers(0, int(rng.integers(1, 10)), n)
+    _, group_ids = np.unique(group_ids, return_inverse=True)
+    return values, group_ids, np.bincount(group_ids)
+
+
+def test_ks_matches_scipy():
+    rng = np.random.default_rng(0)
+    difference = 0.0
+    for _ in range(300):
+        values, group_ids, group_sizes = random_groups(rng)
+        distances = t_closeness_distances(values, group_ids, group_sizes, ClosenessReference(values), "ks")
+        expected = [stats.ks_2samp(values[group_ids == group], values).statistic
+                    for group in range(len(group_sizes))]
+        difference = max(difference, np.abs(distances - expected).max())
+    assert difference < 1e-12
+
+
+def test_emd_matches_the_cdf_sum():
+    rng = np.random.default_rng(0)
+    difference = 0.0
+    for _ in range(300):
+        values, group_ids, group_sizes = random_groups(rng)
+        reference = ClosenessReference(values)
+        distances = t_closeness_distances(values, group_ids, group_sizes, reference, "emd")
+        m = len(reference.domain)
+        expected = []
+        for group in range(len(group_sizes)):
+            group_values = np.sort(values[group_ids == group])
+            group_cdf = np.searchsorted(group_values, reference.domain, side="right") / len(group_values)
+            expected.append(np.abs(group_cdf - reference.cdf).sum() / (m - 1) if m > 1 else 0.0)
+        difference = max(difference, np.abs(distances - expected).max())
+    assert difference < 1e-12
+
+
+def test_unknown_distance():
+    values = np.array([1.0, 2.0])
+    with pytest.raises(ValueError):
+        t_closeness_distances(values, np.array([0, 0]), np.array([2]), ClosenessReference(values), "chi2")
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.techniques.binning import BinningIndex
+from utils.techniques.generalization import generalization_mask, generalization_categorical_semantic
+
+
+# Row by row implementations the vectorized techniques replaced
+def old_generalization_mask(dataframe, col, num_mask):
+    dfFinal = dataframe.copy(deep=True)
+    mask = "*" * num_mask
+    for index, row in dfFinal.iterrows():
+        number = str(row[col])
+        masked = number[:-num_mask] + mask
+        dfFinal.at[index, col] = masked
+    return dfFinal
+
+
+def old_generalization_categorical_semantic(dataframe, col, hierarchy):
+    dfFinal = dataframe.copy(deep=True)
+    for index, row in dfFinal.iterrows():
+        value = str(row[col])
+        res = "Other"
+        for key, values in hierarchy.items():
+            if value in values:
+                res = key
+                break
+        dfFinal.at[index, col] = res
+    return dfFinal
+
+
+def frames():
+    rng = np.random.default_rng(0)
+    n = 60
+    yield pd.DataFrame({"int": rng.integers(0, 1000, n), "float": rng.normal(size=n),
+                        "str": rng.choice(["madrid", "paris", "rome", "oslo"], n)})
+    yield pd.DataFrame({"int": rng.integers(0, 1000, n), "str": rng.choice(["madrid", "paris", "rome"], n)})
+    yield pd.DataFrame({"int": rng.integers(0, 1000, n),
+                        "str": pd.array(rng.choice(["madrid", "paris", "rome"], n), dtype="string")})
+    yield pd.DataFrame({"int": pd.Series([], dtype=np.int64), "str": pd.Series([], dtype=object)})
+
+
+def assert_same(new, old):
+    try:
+        expected = old()
+    except TypeError:
+        with pytest.raises(TypeError):
+            new()
+        return
+    pd.testing.assert_frame_equal(new(), expected)
+
+
+@pytest.mark.parametrize("col", ["int", "float", "str"])
+@pytest.mark.parametrize("num_mask", [1, 2, 5])
+def test_mask_matches_the_row_by_row_version(col, num_mask):
+    for df in frames():
+        if col in df:
+            assert_same(lambda: generalization_mask(df, col, num_mask),
+                        lambda: old_generalization_mask(df, col, num_mask))
+
+
+@pytest.mark.parametrize("hierarchy", [
+    {"south": ["madrid", "rome"], "north": ["paris", "oslo", "rome"]},
+    {"capital": "madrid paris", "other": "rome"},
+    {"numbers": [str(value) for value in range(500)]},
+])
+def test_categorical_semantic_matches_the_row_by_row_version(hierarchy):
+    for df in frames():
+        for col in ["int", "str"]:
+            assert_same(lambda: generalization_categorical_semantic(df, col, hierarchy),
+                        lambda: old_generalization_categorical_semantic(df, col, hierarchy))
+
+
+def test_categorical_column_rejects_new_categories():
+    df = pd.DataFrame({"str": pd.Categorical(["madrid", "paris"])})
+    hierarchy = {"capital": ["madrid", "paris"]}
+    assert_same(lambda: generalization_categorical_semantic(df, "str", hierarchy),
+                lambda: old_generalization_categorical_semantic(df, "str", hierarchy))
+
+
+def test_binning_index_matches_pd_cut():
+    rng = np.random.default_rng(0)
+    for trial in range(300):
+        n = int(rng.integers(1, 300))
+        values = pd.Series(rng.integers(0, int(rng.integers(1, 50)), n) * rng.random())
+        if trial % 2:
+            values[rng.random(n) < 0.2] = np.nan
+        if values.isna().all():
+            continue
+        index = BinningIndex(values)
+        for step in [0.05, 0.1, 0.25, 0.5]:
+            edges = np.unique(np.append(values.quantile(np.arange(0, 1, step)).to_numpy(), values.max()))
+            if len(edges) == 1:
+                expected = pd.cut(values, bins=1)
+            else:
+                expected = pd.cut(values, bins=edges, include_lowest=True)
+            result = pd.Series(index.generalize(step))
+            pd.testing.assert_series_equal(result, expected.reset_index(drop=True), check_names=False)
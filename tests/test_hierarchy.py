@@ -0,0 +1,32 @@
+import pandas as pd
+
+from utils.Anonymization import Anonymization
+from utils.search.plan import TransformationPlan
+from utils.techniques.hierarchy import Hierarchy
+
+ROWS = [["madrid", "spain", "europe", "*"], ["sevilla", "spain", "europe", "*"], ["paris", "france", "europe", "*"],
+        ["lima", "peru", "america", "*"]]
+
+
+def test_generalize_keeps_higher_labels_and_merges_every_value_at_the_top():
+    hierarchy = Hierarchy(ROWS)
+    values = pd.Series(["madrid", "rome", "france", "lima"])
+    assert list(hierarchy.generalize(values, 1)) == ["spain", "Other", "france", "peru"]
+    assert list(hierarchy.generalize(values, 2)) == ["europe", "Other", "europe", "america"]
+    assert list(hierarchy.generalize(values, 3)) == ["*"] * 4
+
+
+def test_hierarchy_level_follows_the_steps_of_the_plan():
+    df = pd.DataFrame({"id": range(6), "city": ["madrid", "sevilla", "paris", "lima", "spain", "madrid"],
+                       "disease": ["flu", "cold", "flu", "cold", "flu", "cold"]})
+    model = Anonymization(df, ["id"], ["city"], ["disease"], {"city": Hierarchy(ROWS)})
+    hierarchy = model.hierarchies["city"]
+    plan = TransformationPlan(model.dataframeOrigen)
+    assert model.__hierarchy_level__(plan, "city", hierarchy) == hierarchy.level_of(plan.column("city")) == 0
+    for level in [2, 1, 3, 0]:
+        plan = plan.extend("city", "generalization_hierarchy", (hierarchy, level),
+                           pd.Series(hierarchy.generalize(df["city"], level)))
+        assert model.__hierarchy_level__(plan, "city", hierarchy) == hierarchy.level_of(plan.column("city"))
+    base = TransformationPlan(pd.DataFrame({"city": hierarchy.generalize(df["city"], 1)}))
+    moved = base.extend("city", "generalization_hierarchy", (hierarchy, 0))
+    assert model.__hierarchy_level__(moved, "city", hierarchy) == 1
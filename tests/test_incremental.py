@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.metrics.incremental import IncrementalEvaluator
+
+PROPERTIES = [(2, 2, 0.1), (3, None, None), (None, 2, None), (None, None, 0.3), (2, 2, 0.0)]
+
+
+def same_partition(group_ids, other_ids):
+    pairs = set(zip(group_ids, other_ids))
+    return len(pairs) == len(set(group_ids)) == len(set(other_ids))
+
+
+@pytest.mark.parametrize("l_diversity, c", [("distinct", None), ("entropy", None), ("recursive", 2)])
+def test_replace_column_matches_a_new_evaluator(l_diversity, c):
+    rng = np.random.default_rng(1)
+    mismatches = 0
+    for trial in range(300):
+        n = int(rng.integers(1, 80))
+        df = pd.DataFrame({"a": rng.integers(0, 4, n), "b": rng.integers(0, 3, n),
+                           "s": rng.integers(0, 5, n), "s2": rng.integers(0, 3, n)})
+        quasi_identifiers = ["a", "b"] if trial % 3 else ["a", "b", "s2"]
+        sensitive = ["s", "s2"]
+        k, l, t = PROPERTIES[trial % len(PROPERTIES)]
+        t_distance = ["ks", "emd"][trial % 2]
+        evaluator = IncrementalEvaluator(df, quasi_identifiers, sensitive, k, l, t, l_diversity, c, t_distance)
+        for _ in range(4):
+            col = rng.choice(["a", "b", "s", "s2"])
+            changed = rng.random(n) < rng.random()
+            df = df.copy()
+            df.loc[changed, col] = rng.integers(0, 6, changed.sum())
+            evaluator = evaluator.replace_column(col, df[col])
+            full = IncrementalEvaluator(df, quasi_identifiers, sensitive, k, l, t, l_diversity, c, t_distance)
+            if not ((evaluator.keep_mask() == full.keep_mask()).all() and
+                    same_partition(evaluator.group_ids, full.group_ids)):
+                mismatches += 1
+    assert mismatches == 0
+
+
+def test_replace_column_without_changes_returns_the_same_evaluator():
+    df = pd.DataFrame({"a": [1, 1, 2], "s": [1, 2, 3]})
+    evaluator = IncrementalEvaluator(df, ["a"], ["s"], k=2)
+    assert evaluator.replace_column("a", df["a"].copy()) is evaluator
+
+
+def test_memory_usage_counts_the_replaced_column():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"a": rng.integers(0, 90, 10000), "s": rng.normal(size=10000)})
+    evaluator = IncrementalEvaluator(df, ["a"], ["s"], k=2, t=0.1)
+    groups_only = evaluator.group_ids.nbytes + evaluator.group_sizes.nbytes
+    replaced_qi = evaluator.replace_column("a", pd.cut(df["a"], [0, 30, 60, 90], include_lowest=True))
+    # group ids, codes and the object array of the intervals with its objects
+    assert replaced_qi.memory_usage() > 3 * groups_only
+    replaced_sensitive = evaluator.replace_column("s", df["s"] * 2)
+    # values, group ids and the sorted values, domain, cdf and prefix sums of the reference
+    assert replaced_sensitive.memory_usage() >= 6 * df["s"].to_numpy().nbytes
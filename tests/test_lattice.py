@@ -0,0 +1,56 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from utils.Anonymization import Anonymization
+from utils.metrics.grouping import groups_from_codes
+from utils.search.lattice import incognito
+from utils.search.plan import TransformationPlan
+
+
+def test_incognito_finds_every_satisfying_node():
+    rng = np.random.default_rng(0)
+    columns = ["a", "b", "c"]
+    n_levels = {"a": 4, "b": 3, "c": 5}
+    # Coarser codes at each level: a node satisfies when its groups have at least 8 rows
+    codes = {col: [rng.integers(0, 12, 200) // (level + 1) ** 2 for level in range(n_levels[col])]
+             for col in columns}
+
+    def satisfies(subset, node):
+        _, group_sizes = groups_from_codes([codes[col][level] for col, level in zip(subset, node)], [12] * len(node))
+        return group_sizes.min() >= 8
+
+    nodes, evaluations = incognito(columns, n_levels, satisfies)
+    expected = {node for node in itertools.product(*[range(n_levels[col]) for col in columns])
+                if satisfies(tuple(columns), node)}
+    assert {tuple(node) for node in nodes.tolist()} == expected
+    assert evaluations < 4 * 3 * 5
+
+
+def test_lattice_finds_the_best_node():
+    rng = np.random.default_rng(0)
+    n = 400
+    df = pd.DataFrame({"id": range(n), "age": rng.integers(18, 90, n), "zip": rng.integers(28000, 28040, n),
+                       "salary": rng.integers(1000, 5000, n), "disease": rng.choice(["flu", "cold", "covid"], n)})
+    model = Anonymization(df, ["id"], ["age", "zip", "salary"], ["disease"], {})
+    _, utility = model.achieve_klt_lattice(3, 2, None)
+
+    model.reset_dataframe_final()
+    base = model.dataframeFinal
+    plan = TransformationPlan(base)
+    levels = {col: model.__generalization_levels__(base[col], col) for col in model.quasi_identifiers_index}
+    best = 0.0
+    for node in itertools.product(*[range(len(levels[col])) for col in model.quasi_identifiers_index]):
+        newPlan = plan
+        perturbation = 1.0
+        for col, level in zip(model.quasi_identifiers_index, node):
+            if level > 0:
+                technique, params = levels[col][level]
+                newPlan = newPlan.extend(col, technique, params, model.__technique_values__(plan, col, technique,
+                                                                                              params))
+            perturbation += 0.1 * level / (len(levels[col]) - 1)
+        kept = model.__evaluator__(newPlan.frame, 3, 2, None).kept_rows()
+        if kept >= 0.95 * n:
+            best = max(best, kept / n / perturbation)
+    assert abs(utility - best) < 1e-12
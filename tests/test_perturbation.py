@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.techniques.perturbation import perturbation_micro_aggregation, micro_aggregation_bins, mdav_groups
+
+
+def block_sizes(values):
+    return pd.Series(values).dropna().value_counts().to_numpy()
+
+
+def test_micro_aggregation_keeps_the_rows_and_averages_each_block():
+    df = pd.DataFrame({"x": [5, 1, 4, 2, 3, 6], "y": list("abcdef")})
+    dfFinal = perturbation_micro_aggregation(df, "x", 2)
+    assert dfFinal["x"].tolist() == [5.5, 1.5, 3.5, 1.5, 3.5, 5.5]
+    assert dfFinal["y"].tolist() == df["y"].tolist()
+    assert df["x"].tolist() == [5, 1, 4, 2, 3, 6]
+
+
+@pytest.mark.parametrize("length, num_group, size", [(7, 3, 3), (7, 0.3, 3), (10, 0.3, 3), (10, 0.25, 3),
+                                                     (20, 7, 7), (5, 10, 5)])
+def test_micro_aggregation_blocks_have_at_least_the_group_size(length, num_group, size):
+    values = np.random.default_rng(0).permutation(length).astype(np.float64)
+    dfFinal = perturbation_micro_aggregation(pd.DataFrame({"x": values}), "x", num_group)
+    sizes = block_sizes(dfFinal["x"])
+    assert sizes.sum() == length
+    assert sizes.min() >= size
+    # The last rows that can not fill a block join the previous one
+    assert sizes.max() < 2 * size or len(sizes) == 1
+
+
+def test_micro_aggregation_keeps_missing_values():
+    df = pd.DataFrame({"x": [4.0, np.nan, 1.0, 3.0, np.nan, 2.0]})
+    dfFinal = perturbation_micro_aggregation(df, "x", 2)
+    assert dfFinal["x"].isna().tolist() == df["x"].isna().tolist()
+    assert dfFinal["x"].dropna().tolist() == [3.5, 1.5, 3.5, 1.5]
+
+
+def test_micro_aggregation_bins_match_the_blocks():
+    values = np.random.default_rng(1).normal(size=50)
+    upper, means = micro_aggregation_bins(values, 0.2)
+    aggregated = perturbation_micro_aggregation(pd.DataFrame({"x": values}), "x", 0.2)["x"].to_numpy()
+    assert np.allclose(means[np.searchsorted(upper, values, side="left")], aggregated)
+
+
+@pytest.mark.parametrize("k", [2, 3, 5, 10])
+@pytest.mark.parametrize("chunk_size", [None, 40])
+def test_mdav_groups_have_between_k_and_2k_minus_1_records(k, chunk_size):
+    rng = np.random.default_rng(k)
+    for length in [k, 2 * k - 1, 3 * k + 1, 101, 257]:
+        group_ids = mdav_groups(rng.normal(size=(length, 3)), k, chunk_size)
+        sizes = np.bincount(group_ids)
+        assert (group_ids >= 0).all()
+        assert sizes.min() >= k
+        assert sizes.max() <= 2 * k - 1 or len(sizes) == 1
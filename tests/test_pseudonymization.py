@@ -0,0 +1,66 @@
+import hashlib
+import hmac
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.techniques.generateKeys import KeyManager
+from utils.techniques.pseudonymization import pseudonymization_counter, pseudonymization_encryption, \
+    revert_pseudonymization_encryption, hmac_digests, pseudonymization_hmac, revert_pseudonymization_hmac, \
+    DigestCache
+
+
+def test_counter_is_reproducible_with_a_seeded_rng():
+    df = pd.DataFrame({"id": list("abcdea"), "x": range(6)})
+    first, first_mapping = pseudonymization_counter(df, "id", rng=np.random.default_rng(3))
+    second, second_mapping = pseudonymization_counter(df, "id", rng=np.random.default_rng(3))
+    pd.testing.assert_frame_equal(first, second)
+    pd.testing.assert_frame_equal(first_mapping, second_mapping)
+    assert sorted(first["x"]) == list(range(6))
+
+
+@pytest.mark.parametrize("deterministic", [False, True])
+def test_encryption_encodes_missing_values_as_nan(tmp_path, deterministic):
+    keys = KeyManager(str(tmp_path))
+    df = pd.DataFrame({"id": ["a", None, np.nan, "b", pd.NaT]})
+    dfFinal = pseudonymization_encryption(df, "id", deterministic, keys=keys)
+    dfReversible = revert_pseudonymization_encryption(dfFinal, "id", deterministic, keys=keys)
+    assert dfReversible["id"].tolist() == ["a", "nan", "nan", "b", "nan"]
+
+
+def test_hmac_digest_does_not_depend_on_the_other_rows():
+    secret_key = b"k" * 32
+    values = pd.Series(["ana", "luis", "ana", "eva", None])
+    digests = hmac_digests(values, secret_key)
+    assert digests[0] == digests[2] == hmac.new(secret_key, b"ana", hashlib.sha256).hexdigest()
+    shuffled = hmac_digests(values[::-1].reset_index(drop=True), secret_key)
+    assert list(shuffled) == list(digests[::-1])
+    assert list(hmac_digests(pd.Series(["eva"]), secret_key)) == [digests[3]]
+
+
+def test_hmac_round_trip(tmp_path):
+    keys = KeyManager(str(tmp_path))
+    df = pd.DataFrame({"id": ["ana", "luis", "ana", "eva"], "x": range(4)})
+    dfFinal = pseudonymization_hmac(df, "id", keys=keys, store_key_id=True)
+    assert dfFinal["id"].nunique() == 3
+    keys.rotate("secret")
+    dfNew = pseudonymization_hmac(df, "id", keys=keys, store_key_id=True)
+    assert not (dfNew["id"] == dfFinal["id"]).any()
+    both = pd.concat([dfFinal, dfNew], ignore_index=True)
+    dfReversible = revert_pseudonymization_hmac(df, both, "id", keys=keys)
+    assert dfReversible["id"].tolist() == df["id"].tolist() * 2
+
+
+def test_digest_cache_of_another_key_is_discarded(tmp_path):
+    path = str(tmp_path / "digests.json")
+    values = pd.Series(["ana", "luis"])
+    cache = DigestCache(path)
+    first = hmac_digests(values, b"a" * 32, cache)
+    assert list(hmac_digests(values, b"a" * 32, DigestCache(path))) == list(first)
+    other = DigestCache(path)
+    second = hmac_digests(values, b"b" * 32, other)
+    assert list(second) == [hmac.new(b"b" * 32, value.encode(), hashlib.sha256).hexdigest() for value in values]
+    # The digests of the first key are not kept next to the new ones
+    assert set(second) <= set(other.digests.values())
+    assert not set(first) & set(other.digests.values())
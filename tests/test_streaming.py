@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from utils.streaming import StreamingAnonymization
+
+
+def write_csv(path, n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"name": ["person%d" % i for i in range(n)],
+                       "age": rng.integers(18, 90, n),
+                       "zip": rng.choice([28001, 28002, 28003, 8001, 8002], n),
+                       "gender": rng.choice(["F", "M"], n),
+                       "disease": rng.choice(["flu", "cold", "asthma", "covid"], n)})
+    df.to_csv(path, index=False)
+    return df
+
+
+def test_fit_transform_achieves_k_and_l_over_several_chunks(tmp_path):
+    write_csv(tmp_path / "input.csv")
+    quasi_identifiers = ["age", "zip", "gender"]
+    streaming = StreamingAnonymization(str(tmp_path / "input.csv"), ["name"], quasi_identifiers, ["disease"], {},
+                                       chunksize=400, sample_size=1000, seed=1)
+    streaming.fit(5, 2, None)
+    rows = streaming.transform(str(tmp_path / "output.csv"), k=5, l=2)
+    output = pd.read_csv(tmp_path / "output.csv")
+    assert streaming.rows_read == 3000
+    assert rows == len(output) > 0
+    groups = output.groupby(quasi_identifiers, dropna=False)
+    assert groups.size().min() >= 5
+    assert groups["disease"].nunique().min() >= 2
+
+
+def test_count_groups_matches_groupby(tmp_path):
+    df = write_csv(tmp_path / "input.csv", n=5000)
+    df["age"] = df["age"] // 10
+    df.to_csv(tmp_path / "input.csv", index=False)
+    quasi_identifiers = ["age", "zip", "gender"]
+    streaming = StreamingAnonymization(str(tmp_path / "input.csv"), ["name"], quasi_identifiers, ["disease"], {},
+                                       chunksize=300)
+    for k, l in [(20, 3), (40, None), (None, 4)]:
+        groups = df.groupby(quasi_identifiers)
+        achieved = pd.Series(True, index=groups.size().index)
+        if k is not None:
+            achieved &= groups.size() >= k
+        if l is not None:
+            achieved &= groups["disease"].nunique() >= l
+        expected = pd.util.hash_pandas_object(achieved[achieved].index.to_frame(index=False), index=False)
+        assert sorted(streaming.count_groups(k, l).tolist()) == sorted(expected.tolist())
@@ -1,11 +1,24 @@
 ##########################################
 # FUNCTIONS WITH ANONYMITY PROPERTIES  #
 ##########################################
-import random
-from scipy import stats
-from utils.techniques.generalization import generalization_categorical_semantic, generalization_mask, \
-    generalization_numerical_interval
-from utils.techniques.perturbation import *
+import heapq
+import time
+import numpy as np
+import pandas as pd
+from utils.metrics.grouping import generate_groups, factorize_column, groups_from_codes, discernibility
+from utils.metrics.diversity import group_value_counts, distinct_l_diversity, entropy_l_diversity, \
+    recursive_cl_diversity, l_diverse_groups
+from utils.metrics.closeness import ClosenessReference, t_closeness_distances
+from utils.metrics.incremental import IncrementalEvaluator
+from utils.search.plan import TransformationPlan, apply_technique
+from utils.search.overlay import ColumnOverlay
+from utils.search.cache import TechniqueCache, DETERMINISTIC_TECHNIQUES, is_random_fingerprint
+from utils.search.parallel import fork_context, achieve_klt_random_parallel, achieve_klt_backtracking_parallel
+from utils.search.lattice import incognito
+from utils.techniques.hierarchy import compile_hierarchies
+from utils.techniques.binning import BinningIndex
+from utils.techniques.perturbation import perturbation_mdav, information_loss, noise_matrix, NOISE_DISTRIBUTIONS
+from utils.search.mondrian import ordered_values, mondrian_partitions, partition_widths, generalize_partitions
 
 """
 Definition of K-ANONYMITY:
@@ -32,36 +45,93 @@ similar to the original data distribution
 
 class Anonymization:
     def __init__(self, dataframeOrigen, identifiers_index, quasi_identifiers_index, sensible_index,
-                 categories_hierarchy):
+                 categories_hierarchy, l_diversity="distinct", c=None, t_distance="ks", seed=None,
+                 copy=True, cache_max_entries=1024, cache_max_bytes=256 * 1024 * 1024):
         """
         :param identifiers_index: column index of identifiers
         :param quasi_identifiers_index: column index of quasi_identifiers
         :param sensible_index: column index of sensible data
+        :param categories_hierarchy: {column: Hierarchy, dict of categories or path of an ARX hierarchy file}
+        :param l_diversity: l-diversity variant used to achieve l ("distinct", "entropy" or "recursive")
+        :param c: c property of recursive (c,l)-diversity
+        :param t_distance: distance used to measure t-closeness ("ks" or "emd")
+        :param seed: seed of the random generator of the model (None for a random seed)
+        :param copy: copy dataframeOrigen (False to use it directly, the model never modifies it)
+        :param cache_max_entries: maximum number of entries of the cache of technique results of the searches
+        :param cache_max_bytes: memory cap in bytes of the cache of technique results of the searches
         """
-        self.dataframeOrigen = dataframeOrigen.copy(deep=True)
-        self.dataframeFinal = dataframeOrigen.copy(deep=True)
+        self.dataframeOrigen = dataframeOrigen.copy(deep=True) if copy else dataframeOrigen
+        # dataframeFinal shares the columns of dataframeOrigen until the anonymization replaces them
+        self.dataframeFinal = ColumnOverlay(self.dataframeOrigen)
         self.identifiers_index = identifiers_index
         self.quasi_identifiers_index = quasi_identifiers_index
         self.sensible_index = sensible_index
         self.categories_hierarchy = categories_hierarchy
+        self.hierarchies = compile_hierarchies(categories_hierarchy)
+        self.l_diversity = l_diversity
+        self.c = c
+        self.t_distance = t_distance
+        self.references = {}
+        self.cache = TechniqueCache(cache_max_entries, cache_max_bytes)
         self.k = 0
         self.l = 0
         self.t = 0
         self.utility = 1.0
+        self.steps = ()
         self.iter = 0
         self.MAX_ITERS = None
         self.stop_utility = None
         self.list_cols = None
+        self.bound = None
+        self.deadline = None
+        self.start_time = None
+        self.on_progress = None
+        self.lattice_evaluations = 0
+        self.n_partitions = 0
+        self.noise_batch = 64
+        self.set_seed(seed)
         self.get_k_anonymity()  # Get the actual K
         self.get_l_diversity()  # Get the actual L
         self.get_t_closeness()  # Get the actual T
 
+    @property
+    def dataframeFinal(self):
+        # The searches read the ColumnOverlay in _dataframeFinal, outside them it is materialized once
+        if isinstance(self._dataframeFinal, ColumnOverlay):
+            self._dataframeFinal = self._dataframeFinal.to_dataframe()
+        return self._dataframeFinal
+
+    @dataframeFinal.setter
+    def dataframeFinal(self, dataframe):
+        # Any new dataframeFinal invalidates the cached privacy report
+        self._dataframeFinal = dataframe
+        self.report = None
+        self.sensitive_counts = None
+
+    def set_seed(self, seed=None):
+        """
+        Reset the random generator of the model, used by the searches and the random techniques
+        :param seed: int, SeedSequence or None for a random seed
+        """
+        self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence)
+        # Standard noise drawn in bulk, {(distribution, rows): [array (candidates, rows), next candidate]}
+        self.noise_pool = {}
+
+    def spawn_seeds(self, n):
+        """
+        Independent streams for n workers, derived from the seed of the model
+        :return: list of SeedSequence
+        """
+        return self.seed_sequence.spawn(n)
+
     def reset_dataframe_final(self):
-        self.dataframeFinal = self.dataframeOrigen.copy(deep=True)
+        self.dataframeFinal = ColumnOverlay(self.dataframeOrigen)
         self.k = 0
         self.l = 0
         self.t = 0
         self.utility = 1.0
+        self.steps = ()
         self.iter = 0
         self.MAX_ITERS = None
         self.stop_utility = None
@@ -69,17 +139,62 @@ class Anonymization:
 
     def __generate_groups__(self, df):
         """
-        Iterate the self.dataframeFinal and generate a list of groups with the same quasi-identifiers
+        Generate the equivalence classes of df using the quasi-identifiers
+        :return: (group_ids, group_sizes) with the group id of each row and the number of rows of each group
+        """
+        return generate_groups(df, self.quasi_identifiers_index)
+
+    def __reference__(self, col):
+        """
+        Global distribution of a sensitive column of dataframeOrigen, sorted only once
+        """
+        if col not in self.references:
+            self.references[col] = ClosenessReference(self.dataframeOrigen[col])
+        return self.references[col]
+
+    def __sensitive_value_counts__(self, df, group_ids):
+        """
+        Grouped value counts of every sensitive column, shared by all the l-diversity variants
+        :return: dict {column: (pair_groups, pair_counts)}
+        """
+        return {col: group_value_counts(df[col], group_ids) for col in self.sensible_index}
+
+    def compute_privacy_report(self):
+        """
+        Compute k, l and t of dataframeFinal with a single grouping pass.
+        The report is cached until dataframeFinal changes.
+        :return: dict with
+        - k: size of the smallest group
+        - l: number of different sensitive values of the least diverse group, by sensitive column
+        - l_entropy: lowest exp(entropy) of the sensitive values of a group, by sensitive column
+        - t: lowest distance (t_distance) between a group and dataframeOrigen, by sensitive column
+        - group_sizes: histogram of group sizes {size: number of groups}
         """
-        groups_index = {}
-        for index, row in df.iterrows():
-            valueQuasiIdentifier = ""
-            for i in self.quasi_identifiers_index:
-                valueQuasiIdentifier += str(row[i])
-            if not valueQuasiIdentifier in groups_index:
-                groups_index[valueQuasiIdentifier] = []
-            groups_index[valueQuasiIdentifier].append(index)
-        return groups_index
+        if self.report is not None:
+            return self.report
+        df = self._dataframeFinal
+        group_ids, group_sizes = self.__generate_groups__(df)
+        counts = self.__sensitive_value_counts__(df, group_ids)
+        l = {}
+        l_entropy = {}
+        t = {}
+        for col in self.sensible_index:
+            pair_groups, pair_counts = counts[col]
+            l[col] = int(distinct_l_diversity(pair_groups, pair_counts, group_sizes).min(initial=len(df)))
+            l_entropy[col] = float(entropy_l_diversity(pair_groups, pair_counts, group_sizes).min(initial=len(df)))
+            distances = t_closeness_distances(df[col], group_ids, group_sizes, self.__reference__(col),
+                                              self.t_distance)
+            t[col] = float(distances.min(initial=1.0))
+        sizes, sizes_counts = np.unique(group_sizes, return_counts=True)
+        self.sensitive_counts = (group_sizes, counts)
+        self.report = {
+            "k": int(sizes[0]) if len(sizes) else 0,
+            "l": l,
+            "l_entropy": l_entropy,
+            "t": t,
+            "group_sizes": dict(zip(sizes.tolist(), sizes_counts.tolist()))
+        }
+        return self.report
 
     def get_k_anonymity(self):
         """
@@ -87,8 +202,7 @@ class Anonymization:
         :return: k
         - Check if the number of unique rows by a list of columns are greater than k
         """
-        unique_counts_rows = self.dataframeFinal.value_counts(self.quasi_identifiers_index)
-        self.k = unique_counts_rows.min()
+        self.k = self.compute_privacy_report()["k"]
         return self.k
 
     def check_k_anonymity(self, k):
@@ -98,8 +212,7 @@ class Anonymization:
         :return: Boolean
         - Check if the number of unique rows by a list of columns are greater than k
         """
-        unique_counts_rows = self.dataframeFinal.value_counts(self.quasi_identifiers_index).tolist()
-        return all(n >= k for n in unique_counts_rows)
+        return all(size >= k for size in self.compute_privacy_report()["group_sizes"])
 
     def check_l_diversity(self, l):
         """
@@ -108,47 +221,40 @@ class Anonymization:
         :param l: l property
         :return: Boolean
         """
-        groups_index = self.__generate_groups__(self.dataframeFinal)
-        for key, rows_index in groups_index.items():
-            l_res = 0
-            sensitiveValues = {}
+        return all(length >= l for length in self.compute_privacy_report()["l"].values())
 
-            for i in self.sensible_index:
-                sensitiveValues[i] = []
+    def get_l_diversity(self):
+        self.l = min(self.compute_privacy_report()["l"].values(), default=len(self._dataframeFinal))
+        return self.l
 
-            for index in rows_index:
-                for i in self.sensible_index:
-                    value = self.dataframeFinal.at[index, i]
-                    if value not in sensitiveValues[i]:
-                        sensitiveValues[i].append(value)
+    def get_entropy_l_diversity(self):
+        return min(self.compute_privacy_report()["l_entropy"].values(), default=len(self._dataframeFinal))
 
-            for i in self.sensible_index:
-                length = len(sensitiveValues[i])
-                if length < l:
-                    return False
-        return True
+    def check_entropy_l_diversity(self, l):
+        """
+        Check if dataframeFinal has entropy l-diversity property.
+        - Check if the entropy of the sensitive values of each group is at least log(l)
+        :param l: l property
+        :return: Boolean
+        """
+        return all(length >= l - 1e-9 for length in self.compute_privacy_report()["l_entropy"].values())
 
-    def get_l_diversity(self):
-        groups_index = self.__generate_groups__(self.dataframeFinal)
-        l = len(self.dataframeFinal)
-        for key, rows_index in groups_index.items():
-            sensitiveValues = {}
-
-            for i in self.sensible_index:
-                sensitiveValues[i] = []
-
-            for index in rows_index:
-                for i in self.sensible_index:
-                    value = self.dataframeFinal.at[index, i]
-                    if value not in sensitiveValues[i]:
-                        sensitiveValues[i].append(value)
-
-            for i in self.sensible_index:
-                length = len(sensitiveValues[i])
-                if length < l:
-                    l = length
-        self.l = l
-        return l
+    def check_recursive_l_diversity(self, c, l):
+        """
+        Check if dataframeFinal has recursive (c,l)-diversity property.
+        - Check if in each group the most frequent sensitive value appears less than c times
+        the sum of the l-th to the least frequent ones
+        :param c: c property
+        :param l: l property
+        :return: Boolean
+        """
+        self.compute_privacy_report()
+        group_sizes, counts = self.sensitive_counts
+        for col in self.sensible_index:
+            pair_groups, pair_counts = counts[col]
+            if not recursive_cl_diversity(pair_groups, pair_counts, group_sizes, c, l).all():
+                return False
+        return True
 
     def check_t_closeness(self, t):
         """
@@ -157,86 +263,198 @@ class Anonymization:
         :param t: t property
         :return: Boolean
         """
-        groups_index = self.__generate_groups__(self.dataframeFinal)
-        for key, rows_index in groups_index.items():
-            dfAux = self.dataframeFinal[self.dataframeFinal.index.isin(rows_index)]
-            for col in self.sensible_index:
-                statistic, pvalue = stats.ks_2samp(self.dataframeOrigen[col], dfAux[col])
-                if statistic < t:  # Reject Null Hypothesis, accept Alternative Hypothesis (The distributions are different)
-                    return False
-        return True
+        # Reject Null Hypothesis, accept Alternative Hypothesis (The distributions are different)
+        return all(statistic >= t for statistic in self.compute_privacy_report()["t"].values())
 
     def get_t_closeness(self):
-        t = 1.0
-        groups_index = self.__generate_groups__(self.dataframeFinal)
-        for key, rows_index in groups_index.items():
-            dfAux = self.dataframeFinal[self.dataframeFinal.index.isin(rows_index)]
-            for col in self.sensible_index:
-                statistic, pvalue = stats.ks_2samp(self.dataframeOrigen[col], dfAux[col])
-                if statistic < t:
-                    t = statistic
-        self.t = t
-        return t
+        self.t = min(self.compute_privacy_report()["t"].values(), default=1.0)
+        return self.t
 
     """
     ACHIEVE K-L-T IN ONE METHOD
     """
 
+    def __evaluator__(self, df, k=None, l=None, t=None):
+        """
+        Groups of df and whether each one achieves k-anonymity, l-diversity and t-closeness
+        :return: IncrementalEvaluator
+        """
+        return IncrementalEvaluator(df, self.quasi_identifiers_index, self.sensible_index, k, l, t,
+                                    self.l_diversity, self.c, self.t_distance)
+
     def __achieve_klt__(self, df, k=None, l=None, t=None):
         """
         Delete all the groups has not achieve k-anonymity, l-diversity or t-closeness
+        :param df: Dataframe or ColumnOverlay
         :param t: t-property
         :return: dataframeFinal
         """
-        dfResult = df.copy(deep=True)
-        dfGroups = self.__generate_groups__(df)
-        for key, rows_index in dfGroups.items():
-            if k is not None:
-                # K-ANONYMITY
-                if len(rows_index) < k:
-                    dfResult.drop(dfGroups[key], axis=0, inplace=True)
-                    continue
-            if t is not None:
-                # T-CLOSENESS
-                dfAux = df[df.index.isin(rows_index)]
-                statistic = 0.0
-                for col in self.sensible_index:
-                    statistic, pvalue = stats.ks_2samp(df[col], dfAux[col])
-                    if statistic < t:
-                        dfResult.drop(dfGroups[key], axis=0, inplace=True)
-                        break
-                if statistic < t:
-                    continue
-            if l is not None:
-                # L-DIVERSITY
-                sensitiveValues = {}
-                for i in self.sensible_index:
-                    sensitiveValues[i] = []
-                for index in rows_index:
-                    for i in self.sensible_index:
-                        value = dfResult.at[index, i]
-                        if value not in sensitiveValues[i]:
-                            sensitiveValues[i].append(value)
-                for i in self.sensible_index:
-                    length = len(sensitiveValues[i])
-                    if length < l:
-                        dfResult.drop(dfGroups[key], axis=0, inplace=True)
-                        break
-        return dfResult
-
-    def achieve_klt_backtracking(self, k, l, t, stop_utility=1.0, MAX_ITERS=1000):
+        return df[self.__evaluator__(df, k, l, t).keep_mask()]
+
+    def __techniques__(self, plan, col, n, steps):
+        """
+        Candidate techniques of one family for a column
+        :param plan: TransformationPlan with the actual values of the column
+        :param n: family of techniques: 0 hierarchy, 1 numerical, 2 mask, 3 permutation, 4 noise, 5 micro-aggregation
+        :param steps: steps of the numerical generalization
+        :return: list of (technique, params, perturbation added by the technique)
+        """
+        if n == 0:
+            # GENERALIZATION CATEGORIES: move the column to any other level of its hierarchy
+            hierarchy = self.hierarchies.get(col)
+            if hierarchy is None:
+                return []
+            current = self.__hierarchy_level__(plan, col, hierarchy)
+            return [("generalization_hierarchy", (hierarchy, level), level * 0.1)
+                    for level in range(hierarchy.n_levels) if level != current]
+        elif n == 1:
+            # GENERALIZATION NUMERICAL
+            return [("generalization_numerical_interval", (step,), step * 0.1) for step in steps]
+        elif n == 2:
+            # GENERALIZATION MASK
+            average_length_strings = int(plan.column(col).astype(str).str.len().mean())
+            step = max(int(average_length_strings / 3), 1)
+            quantiles = np.arange(1, average_length_strings, step)
+            return [("generalization_mask", (num_mask,), average_length_strings / num_mask * 0.1)
+                    for num_mask in quantiles]
+        # PERTURBATION TECHNIQUES
+        elif n == 3:
+            return [("perturbation_permutation", (), 0.1)]
+        elif n == 4:
+            return [("perturbation_noise_addition", (), 0.1)]
+        elif n == 5:
+            return [("perturbation_micro_aggregation", (num_group,), num_group)
+                    for num_group in np.arange(0.1, 0.9, 0.2)]
+        return []
+
+    def __hierarchy_level__(self, plan, col, hierarchy):
+        """
+        Level of the hierarchy of the actual values of col, without looking them up: the hierarchy steps generalize
+        the base column, whose level is looked up once and memoized in self.cache, and keep its higher labels
+        """
+        col_steps = [step for step in plan.steps if step[0] == col]
+        if any(step[1] != "generalization_hierarchy" for step in col_steps):
+            # Another technique changed the values, they have to be looked up
+            return hierarchy.level_of(plan.column(col))
+        level_key = ("level", plan.base_fingerprint(col), repr(hierarchy))
+        level = self.cache.get(level_key)
+        if level is None:
+            level = hierarchy.level_of(plan.base[col])
+            self.cache.put(level_key, level, 0)
+        return max(level, col_steps[-1][2][1]) if col_steps else level
+
+    def __technique_values__(self, plan, col, technique, params):
+        """
+        Values of col after applying one technique to the plan.
+        The results of deterministic techniques are memoized in self.cache.
+        :return: Series
+        """
+        if technique not in DETERMINISTIC_TECHNIQUES:
+            return apply_technique(plan.column(col), technique, params,
+                                   **self.__random_arguments__(technique, len(plan.base)))
+        if is_random_fingerprint(plan.fingerprint(col)):
+            # The column comes from a random technique, its results would never be hit
+            if technique == "generalization_numerical_interval":
+                params = params + (BinningIndex(plan.column(col)),)
+            return apply_technique(plan.column(col), technique, params)
+        column_key = ("column", plan.fingerprint(col), technique, repr(params))
+        values = self.cache.get(column_key)
+        if values is None:
+            source = plan.column(col)
+            if technique == "generalization_hierarchy" and \
+                    all(step[1] == technique for step in plan.steps if step[0] == col):
+                # The levels are computed from the original values, so the column can also move down
+                source = plan.base[col]
+            elif technique == "generalization_numerical_interval":
+                # Every step of the column reuses the same sorted values
+                params = params + (self.__binning_index__(plan, col),)
+            values = apply_technique(source, technique, params)
+            self.cache.put(column_key, values, int(values.memory_usage(index=False)))
+        return values
+
+    def __random_arguments__(self, technique, length):
+        """
+        Random generator of a random technique, and its standard noise for the noise techniques
+        :return: dict with the keyword arguments of the technique
+        """
+        arguments = {"rng": self.rng}
+        if technique in NOISE_DISTRIBUTIONS:
+            arguments["noise"] = self.__standard_noise__(NOISE_DISTRIBUTIONS[technique], length)
+        return arguments
+
+    def __standard_noise__(self, distribution, length):
+        """
+        Standard noise of one candidate. The noise of the next candidates is drawn in bulk with a single
+        (candidates, rows) draw, limited to 64 MB.
+        :return: array with length values
+        """
+        pool = self.noise_pool.get((distribution, length))
+        if pool is None or pool[1] >= len(pool[0]):
+            n_candidates = max(1, min(self.noise_batch, 2 ** 26 // max(8 * length, 1)))
+            pool = [noise_matrix(self.rng, n_candidates, length, distribution), 0]
+            self.noise_pool[(distribution, length)] = pool
+        noise = pool[0][pool[1]]
+        pool[1] += 1
+        return noise
+
+    def __binning_index__(self, plan, col):
+        """
+        BinningIndex of the actual values of col, memoized in self.cache
+        """
+        index_key = ("binning", plan.fingerprint(col))
+        index = self.cache.get(index_key)
+        if index is None:
+            index = BinningIndex(plan.column(col))
+            self.cache.put(index_key, index, index.memory_usage())
+        return index
+
+    def __apply_technique__(self, plan, evaluator, col, technique, params, values=None):
+        """
+        Extend the plan with one technique and evaluate it incrementally from the evaluator of the plan.
+        The results of deterministic techniques are memoized in self.cache.
+        :param values: result of the technique if it is already known
+        :return: (newPlan, newEvaluator, number of rows that achieve k-l-t)
+        """
+        if values is None:
+            values = self.__technique_values__(plan, col, technique, params)
+        newPlan = plan.extend(col, technique, params, values)
+        fingerprints = tuple(newPlan.fingerprint(c) for c in self.quasi_identifiers_index + self.sensible_index)
+        if any(is_random_fingerprint(fingerprint) for fingerprint in fingerprints):
+            # A state with a random column (this one or an earlier one) is never seen again, so it is not cached
+            # and does not evict the useful entries
+            newEvaluator = evaluator.replace_column(col, newPlan.column(col))
+            return newPlan, newEvaluator, newEvaluator.kept_rows()
+        score_key = ("score", evaluator.k, evaluator.l, evaluator.t, self.l_diversity, self.c,
+                     self.t_distance) + fingerprints
+        newEvaluator = self.cache.get(score_key)
+        if newEvaluator is None:
+            newEvaluator = evaluator.replace_column(col, newPlan.column(col))
+            self.cache.put(score_key, newEvaluator, newEvaluator.memory_usage())
+        return newPlan, newEvaluator, newEvaluator.kept_rows()
+
+    def __search_start__(self, k, l, t, seed=None):
+        """
+        Initial state of a search: the actual dataframe without techniques, keeping the groups that achieve k-l-t
+        :param seed: reset the random generator of the model before the search (None to keep it)
+        :return: (plan, evaluator, perturbation, best_utility, best_plan)
+        """
+        if seed is not None:
+            self.set_seed(seed)
         perturbation = 1.0
-        df = self.dataframeFinal
-        best_df = self.__achieve_klt__(df, k, l, t)
-        best_utility = (float(len(best_df)) / len(df)) / perturbation
-        list_cols = self.quasi_identifiers_index.copy()
-        list_cols.extend(self.sensible_index)
-        random.shuffle(list_cols)
-        self.iter = 0
-        self.MAX_ITERS = MAX_ITERS
-        self.stop_utility = stop_utility
-        self.list_cols = list_cols
-        best_df, best_utility = self.__achieve_klt_backtracking__(0, k, l, t, df, perturbation, best_utility, best_df)
+        df = self._dataframeFinal
+        plan = TransformationPlan(df)
+        evaluator = self.__evaluator__(df, k, l, t)
+        best_plan = plan.filtered(evaluator.keep_mask())
+        best_utility = (float(evaluator.kept_rows()) / len(df)) / perturbation
+        return plan, evaluator, perturbation, best_utility, best_plan
+
+    def __search_end__(self, best_plan, best_utility):
+        """
+        Keep the best plan of a search as dataframeFinal, and its steps in self.steps
+        :return: (best_df, best_utility)
+        """
+        best_df = best_plan.materialize()
+        self.steps = best_plan.steps
         self.dataframeFinal = best_df
         self.get_k_anonymity()
         self.get_l_diversity()
@@ -244,237 +462,471 @@ class Anonymization:
         self.utility = best_utility
         return best_df, best_utility
 
-    def __achieve_klt_backtracking__(self, start, k, l, t, df, perturbation, best_utility, best_df):
+    def __start_clock__(self, time_budget_s=None, on_progress=None):
+        """
+        :param time_budget_s: seconds for the search (None for no limit)
+        :param on_progress: function(iter, best_utility, elapsed) called after every iteration
+        """
+        self.start_time = time.monotonic()
+        self.deadline = None if time_budget_s is None else self.start_time + time_budget_s
+        self.on_progress = on_progress
+
+    def __out_of_time__(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def __progress__(self, best_utility):
+        if self.on_progress is not None:
+            self.on_progress(self.iter, best_utility, time.monotonic() - self.start_time)
+
+    def __backtracking_start__(self, stop_utility, MAX_ITERS):
+        list_cols = self.quasi_identifiers_index.copy()
+        list_cols.extend(self.sensible_index)
+        self.rng.shuffle(list_cols)
+        self.iter = 0
+        self.MAX_ITERS = MAX_ITERS
+        self.stop_utility = stop_utility
+        self.list_cols = list_cols
+
+    def achieve_klt_backtracking(self, k, l, t, stop_utility=1.0, MAX_ITERS=1000, workers=None, seed=None,
+                                 time_budget_s=None, on_progress=None):
+        """
+        Backtracking search of techniques
+        :param MAX_ITERS: budget of iterations (None for no limit)
+        :param workers: number of processes to explore the top-level branches in parallel (None or 1 to run serially)
+        :param seed: seed of the random generator of the search (None to continue with the generator of the model).
+        Each parallel branch draws from its own stream spawned from it.
+        :param time_budget_s: seconds for the search (None for no limit). The best plan found so far is returned.
+        :param on_progress: function(iter, best_utility, elapsed) called after every iteration
+        :return: (best_df, best_utility)
+        """
+        plan, evaluator, perturbation, best_utility, best_plan = self.__search_start__(k, l, t, seed)
+        self.__backtracking_start__(stop_utility, MAX_ITERS)
+        self.__start_clock__(time_budget_s, on_progress)
+        if workers is not None and workers > 1 and fork_context() is not None and best_utility < stop_utility:
+            best_plan, best_utility = achieve_klt_backtracking_parallel(self, k, l, t, plan, evaluator, perturbation,
+                                                                        best_utility, best_plan, MAX_ITERS, workers)
+        else:
+            best_plan, best_utility = self.__achieve_klt_backtracking__(0, k, l, t, plan, evaluator, perturbation,
+                                                                        best_utility, best_plan)
+        return self.__search_end__(best_plan, best_utility)
+
+    def iter_klt_backtracking(self, k, l, t, stop_utility=1.0, MAX_ITERS=1000, time_budget_s=None,
+                              on_progress=None, seed=None):
+        """
+        Backtracking search of techniques that yields every improvement as soon as it is found.
+        When the generator is exhausted the best dataframe is kept as dataframeFinal.
+        :return: generator of (best_df, best_utility)
+        """
+        plan, evaluator, perturbation, best_utility, best_plan = self.__search_start__(k, l, t, seed)
+        self.__backtracking_start__(stop_utility, MAX_ITERS)
+        self.__start_clock__(time_budget_s, on_progress)
+        improvements = self.__backtracking_improvements__(0, k, l, t, plan, evaluator, perturbation, best_utility,
+                                                          best_plan)
+        while True:
+            try:
+                best_plan, best_utility = next(improvements)
+            except StopIteration as result:
+                best_plan, best_utility = result.value
+                break
+            yield best_plan.materialize(), best_utility
+        self.__search_end__(best_plan, best_utility)
+
+    def __bound__(self, best_utility):
+        """
+        Best utility known by the search, including the other workers of a parallel search
+        """
+        if self.bound is None:
+            return best_utility
+        return max(best_utility, self.bound.value)
+
+    def __share_bound__(self, utility):
+        """
+        Publish a new best utility to the other workers of a parallel search
+        """
+        if self.bound is not None:
+            with self.bound.get_lock():
+                if utility > self.bound.value:
+                    self.bound.value = utility
+
+    def __achieve_klt_backtracking__(self, start, k, l, t, plan, evaluator, perturbation, best_utility, best_plan):
         """
         Add generalization and perturbation techniques
+        :return: (best_plan, best_utility)
         """
-        if best_utility >= self.stop_utility:
-            return best_df, best_utility
+        improvements = self.__backtracking_improvements__(start, k, l, t, plan, evaluator, perturbation,
+                                                          best_utility, best_plan)
+        while True:
+            try:
+                next(improvements)
+            except StopIteration as result:
+                return result.value
+
+    def __backtracking_improvements__(self, start, k, l, t, plan, evaluator, perturbation, best_utility,
+                                      best_plan):
+        """
+        Add generalization and perturbation techniques.
+        Generator: yields (best_plan, best_utility) every time the best plan improves and returns the final pair
+        """
+        if self.__bound__(best_utility) >= self.stop_utility or self.__out_of_time__():
+            return best_plan, best_utility
 
         self.iter += 1
-        if self.iter > self.MAX_ITERS:
-            return best_df, best_utility
+        if self.MAX_ITERS is not None and self.iter > self.MAX_ITERS:
+            return best_plan, best_utility
+        self.__progress__(best_utility)
 
+        length = len(plan.base)
         for i in range(start, len(self.list_cols)):
             col = self.list_cols[i]
-            best_df, best_utility = self.__achieve_klt_backtracking__(start + 1, k, l, t, df, perturbation,
-                                                                      best_utility, best_df)
-            if best_utility >= self.stop_utility:
-                return best_df, best_utility
-            # GENERALIZATION CATEGORIES
-            try:
-                categories = self.categories_hierarchy.get(col)
-                if categories is not None:
-                    newDf = generalization_categorical_semantic(df, col, categories)
-                    dfResult = self.__achieve_klt__(newDf, k, l, t)
-                    utility = (float(len(dfResult)) / len(df)) / (perturbation + 0.1)
+            best_plan, best_utility = yield from self.__backtracking_improvements__(start + 1, k, l, t, plan,
+                                                                                   evaluator, perturbation,
+                                                                                   best_utility, best_plan)
+            if self.__bound__(best_utility) >= self.stop_utility:
+                return best_plan, best_utility
+            for n in range(6):
+                for technique, params, cost in self.__techniques__(plan, col, n, [0.1, 0.25, 0.4]):
+                    if self.bound is not None and 1.0 / (perturbation + cost) <= self.__bound__(best_utility):
+                        # Prune: the utility of this branch can not be higher than the best one
+                        continue
+                    if self.__out_of_time__():
+                        return best_plan, best_utility
+                    try:
+                        newPlan, newEvaluator, kept = self.__apply_technique__(plan, evaluator, col, technique,
+                                                                               params)
+                    except:
+                        continue
+                    utility = (float(kept) / length) / (perturbation + cost)
                     if utility > best_utility:
-                        best_df = dfResult
+                        best_plan = newPlan.filtered(newEvaluator.keep_mask())
                         best_utility = utility
-                    best_df, best_utility = self.__achieve_klt_backtracking__(start + 1, k, l, t, newDf,
-                                                                              perturbation + 0.1,
-                                                                              best_utility, best_df)
-                    if best_utility >= self.stop_utility:
-                        return best_df, best_utility
-            except:
-                pass
-            # GENERALIZATION NUMERICAL
-            try:
-                steps = [0.1, 0.25, 0.4]
-                for step in steps:
-                    newDf = generalization_numerical_interval(df, col, step)
-                    dfResult = self.__achieve_klt__(newDf, k, l, t)
-                    utility = (float(len(dfResult)) / len(df)) / (perturbation + step * 0.1)
-                    if utility > best_utility:
-                        best_df = dfResult
-                        best_utility = utility
-                    best_df, best_utility = self.__achieve_klt_backtracking__(start + 1, k, l, t, newDf,
-                                                                              perturbation + step * 0.1,
-                                                                              best_utility, best_df)
-                    if best_utility >= self.stop_utility:
-                        return best_df, best_utility
-            except:
-                pass
-            # GENERALIZATION MASK
-            average_length_strings = int(df[col].apply(str).apply(len).mean())
-            step = max(int(average_length_strings / 3), 1)
-            quantiles = np.arange(1, average_length_strings, step)
-            for num_mask in quantiles:
-                newDf = generalization_mask(df, col, num_mask)
-                dfResult = self.__achieve_klt__(newDf, k, l, t)
-                utility = (float(len(dfResult)) / len(df)) / (perturbation + (average_length_strings / num_mask * 0.1))
-                if utility > best_utility:
-                    best_df = dfResult
-                    best_utility = utility
-                best_df, best_utility = self.__achieve_klt_backtracking__(start + 1, k, l, t, newDf,
-                                                                          perturbation + (
-                                                                                  average_length_strings / num_mask * 0.1),
-                                                                          best_utility, best_df)
-                if best_utility >= self.stop_utility:
-                    return best_df, best_utility
-            # PERTURBATION TECHNIQUES
-            try:
-                newDf = perturbation_permutation(df, col)
-                dfResult = self.__achieve_klt__(newDf, k, l, t)
-                utility = (float(len(dfResult)) / len(df)) / (perturbation + 0.1)
-                if utility > best_utility:
-                    best_df = dfResult
-                    best_utility = utility
-                best_df, best_utility = self.__achieve_klt_backtracking__(start + 1, k, l, t, newDf,
-                                                                          perturbation + 0.1,
-                                                                          best_utility, best_df)
-                if best_utility >= self.stop_utility:
-                    return best_df, best_utility
-            except:
-                pass
-            try:
-                newDf = perturbation_noise_addition(df, col)
-                dfResult = self.__achieve_klt__(newDf, k, l, t)
-                utility = (float(len(dfResult)) / len(df)) / (perturbation + 0.1)
-                if utility > best_utility:
-                    best_df = dfResult
-                    best_utility = utility
-                best_df, best_utility = self.__achieve_klt_backtracking__(start + 1, k, l, t, newDf,
-                                                                          perturbation + 0.1,
-                                                                          best_utility, best_df)
-                if best_utility >= self.stop_utility:
-                    return best_df, best_utility
-            except:
-                pass
-            try:
-                num_groups = np.arange(0.1, 0.9, 0.2)
-                for num_group in num_groups:
-                    newDf = perturbation_micro_aggregation(df, col, num_group)
-                    dfResult = self.__achieve_klt__(newDf, k, l, t)
-                    utility = (float(len(dfResult)) / len(df)) / (perturbation + num_group)
-                    if utility > best_utility:
-                        best_df = dfResult
-                        best_utility = utility
-                    best_df, best_utility = self.__achieve_klt_backtracking__(start + 1, k, l, t, newDf,
-                                                                              perturbation + num_group,
-                                                                              best_utility, best_df)
-                    if best_utility >= self.stop_utility:
-                        return best_df, best_utility
-            except:
+                        self.__share_bound__(utility)
+                        yield best_plan, best_utility
+                    best_plan, best_utility = yield from self.__backtracking_improvements__(start + 1, k, l, t,
+                                                                                           newPlan, newEvaluator,
+                                                                                           perturbation + cost,
+                                                                                           best_utility, best_plan)
+                    if self.__bound__(best_utility) >= self.stop_utility:
+                        return best_plan, best_utility
+        return best_plan, best_utility
+
+    def achieve_klt_random(self, k, l, t, stop_utility=1.0, MAX_ITERS=1000, workers=None, seed=None,
+                           time_budget_s=None, on_progress=None):
+        """
+        Random search of techniques
+        :param workers: number of processes to evaluate the candidates in parallel (None or 1 to run serially)
+        :param seed: seed of the random generator of the search (None to continue with the generator of the model).
+        Each parallel batch draws from its own stream spawned from it.
+        :param time_budget_s: seconds for the search (None for no limit). The best plan found so far is returned.
+        :param on_progress: function(iter, best_utility, elapsed) called after every iteration
+        :return: (best_df, best_utility)
+        """
+        plan, evaluator, perturbation, best_utility, best_plan = self.__search_start__(k, l, t, seed)
+        self.stop_utility = stop_utility
+        self.iter = 0
+        self.__start_clock__(time_budget_s, on_progress)
+        if workers is not None and workers > 1 and fork_context() is not None and best_utility < stop_utility:
+            best_plan, best_utility = achieve_klt_random_parallel(self, k, l, t, plan, evaluator, perturbation,
+                                                                  best_utility, best_plan, MAX_ITERS, workers)
+        else:
+            for best_plan, best_utility in self.__random_improvements__(k, l, t, plan, evaluator, perturbation,
+                                                                        best_utility, best_plan, MAX_ITERS):
                 pass
-        return best_df, best_utility
+        return self.__search_end__(best_plan, best_utility)
 
-    def achieve_klt_random(self, k, l, t, stop_utility=1.0, MAX_ITERS=1000):
-        perturbation = 1.0
-        df = self.dataframeFinal
-        best_df = self.__achieve_klt__(df, k, l, t)
-        best_utility = (float(len(best_df)) / len(df)) / perturbation
+    def iter_klt_random(self, k, l, t, stop_utility=1.0, MAX_ITERS=1000, time_budget_s=None, on_progress=None,
+                        seed=None):
+        """
+        Random search of techniques that yields every improvement as soon as it is found.
+        When the generator is exhausted the best dataframe is kept as dataframeFinal.
+        :return: generator of (best_df, best_utility)
+        """
+        plan, evaluator, perturbation, best_utility, best_plan = self.__search_start__(k, l, t, seed)
         self.stop_utility = stop_utility
+        self.iter = 0
+        self.__start_clock__(time_budget_s, on_progress)
+        for best_plan, best_utility in self.__random_improvements__(k, l, t, plan, evaluator, perturbation,
+                                                                    best_utility, best_plan, MAX_ITERS):
+            yield best_plan.materialize(), best_utility
+        self.__search_end__(best_plan, best_utility)
+
+    def __random_improvements__(self, k, l, t, plan, evaluator, perturbation, best_utility, best_plan, MAX_ITERS):
+        """
+        Iterations of the random search
+        Generator: yields (best_plan, best_utility) every time the best plan improves
+        """
         for i in range(MAX_ITERS):
-            best_df, best_utility = self.__achieve_klt_random__(k, l, t, df, perturbation, best_utility, best_df)
-            if best_utility >= self.stop_utility:
+            if best_utility >= self.stop_utility or self.__out_of_time__():
                 break
-        self.dataframeFinal = best_df
-        self.get_k_anonymity()
-        self.get_l_diversity()
-        self.get_t_closeness()
-        self.utility = best_utility
-        return best_df, best_utility
+            newPlan, utility = self.__achieve_klt_random__(k, l, t, plan, evaluator, perturbation, best_utility,
+                                                           best_plan)
+            self.iter = i + 1
+            if utility > best_utility:
+                best_plan, best_utility = newPlan, utility
+                yield best_plan, best_utility
+            self.__progress__(best_utility)
 
-    def __achieve_klt_random__(self, k, l, t, df, perturbation, best_utility, best_df):
+    def __achieve_klt_random__(self, k, l, t, plan, evaluator, perturbation, best_utility, best_plan):
         if best_utility >= self.stop_utility:
-            return best_df, best_utility
+            return best_plan, best_utility
         list_cols = self.quasi_identifiers_index.copy()
         list_cols.extend(self.sensible_index)
-        i = random.randint(0, len(list_cols) - 1)
+        i = int(self.rng.integers(len(list_cols)))
         col = list_cols[i]
-        best_df, best_utility = self.__generate_random_technique__(k, l, t, df, perturbation, best_utility, best_df,
-                                                                   col)
-        return best_df, best_utility
+        best_plan, best_utility = self.__generate_random_technique__(k, l, t, plan, evaluator, perturbation,
+                                                                     best_utility, best_plan, col)
+        return best_plan, best_utility
 
-    def __generate_random_technique__(self, k, l, t, df, perturbation, best_utility, best_df, col):
-        n = random.randint(0, 5)
-        if n == 0:
-            # GENERALIZATION CATEGORIES
-            try:
-                categories = self.categories_hierarchy.get(col)
-                if categories is not None:
-                    newDf = generalization_categorical_semantic(df, col, categories)
-                    dfResult = self.__achieve_klt__(newDf, k, l, t)
-                    utility = (float(len(dfResult)) / len(df)) / (perturbation + 0.1)
-                    if utility > best_utility:
-                        best_df = dfResult
-                        best_utility = utility
-                    if best_utility >= self.stop_utility:
-                        return best_df, best_utility
-            except:
-                pass
-        elif n == 1:
-            # GENERALIZATION NUMERICAL
+    def __generate_random_technique__(self, k, l, t, plan, evaluator, perturbation, best_utility, best_plan, col):
+        n = int(self.rng.integers(6))
+        techniques = self.__techniques__(plan, col, n, [0.1, 0.2, 0.25, 0.3, 0.4, 0.5])
+        if n in (1, 2) and techniques:
+            # Only one random step of the numerical generalization or the mask
+            techniques = [techniques[int(self.rng.integers(len(techniques)))]]
+        for technique, params, cost in techniques:
             try:
-                steps = [0.1, 0.2, 0.25, 0.3, 0.4, 0.5]
-                n = random.randint(0, len(steps) - 1)
-                step = steps[n]
-                newDf = generalization_numerical_interval(df, col, step)
-                dfResult = self.__achieve_klt__(newDf, k, l, t)
-                utility = (float(len(dfResult)) / len(df)) / (perturbation + step * 0.1)
-                if utility > best_utility:
-                    best_df = dfResult
-                    best_utility = utility
-                if best_utility >= self.stop_utility:
-                    return best_df, best_utility
+                newPlan, newEvaluator, kept = self.__apply_technique__(plan, evaluator, col, technique, params)
             except:
-                pass
-        elif n == 2:
-            # GENERALIZATION MASK
-            average_length_strings = int(df[col].apply(str).apply(len).mean())
-            step = max(int(average_length_strings / 3), 1)
-            quantiles = np.arange(1, average_length_strings, step)
-            n = random.randint(0, len(quantiles) - 1)
-            num_mask = quantiles[n]
-            newDf = generalization_mask(df, col, num_mask)
-            dfResult = self.__achieve_klt__(newDf, k, l, t)
-            utility = (float(len(dfResult)) / len(df)) / (perturbation + (average_length_strings / num_mask * 0.1))
+                continue
+            utility = (float(kept) / len(plan.base)) / (perturbation + cost)
             if utility > best_utility:
-                best_df = dfResult
+                best_plan = newPlan.filtered(newEvaluator.keep_mask())
                 best_utility = utility
             if best_utility >= self.stop_utility:
-                return best_df, best_utility
-        # PERTURBATION TECHNIQUES
-        elif n == 3:
-            try:
-                newDf = perturbation_permutation(df, col)
-                dfResult = self.__achieve_klt__(newDf, k, l, t)
-                utility = (float(len(dfResult)) / len(df)) / (perturbation + 0.1)
-                if utility > best_utility:
-                    best_df = dfResult
-                    best_utility = utility
-                if best_utility >= self.stop_utility:
-                    return best_df, best_utility
-            except:
-                pass
-        elif n == 4:
-            try:
-                newDf = perturbation_noise_addition(df, col)
-                dfResult = self.__achieve_klt__(newDf, k, l, t)
-                utility = (float(len(dfResult)) / len(df)) / (perturbation + 0.1)
+                return best_plan, best_utility
+        return best_plan, best_utility
+
+    def achieve_klt_beam(self, k, l, t, beam_width=5, depth=3, stop_utility=1.0):
+        """
+        Beam search of techniques. At each step every technique on every column not yet transformed by a state of
+        the beam is scored with a cheap estimate from the sizes of the new groups: the rows kept by k, and the
+        discernibility to break ties. Only the beam_width best candidates are evaluated with k, l and t, and they
+        are the states of the next step.
+        :param beam_width: candidates evaluated at each step
+        :param depth: maximum number of techniques
+        :return: (best_df, best_utility)
+        """
+        plan, evaluator, perturbation, best_utility, best_plan = self.__search_start__(k, l, t)
+        length = len(plan.base)
+        list_cols = self.quasi_identifiers_index.copy()
+        list_cols.extend(self.sensible_index)
+        beam = [(plan, evaluator, perturbation, ())]
+        self.iter = 0
+        for step in range(depth):
+            if best_utility >= stop_utility or not beam:
+                break
+            # Min-heap with the beam_width best estimates, so only their values are kept in memory
+            candidates = []
+            for plan, evaluator, perturbation, used in beam:
+                for col in list_cols:
+                    if col in used:
+                        continue
+                    for n in range(6):
+                        for technique, params, cost in self.__techniques__(plan, col, n,
+                                                                           [0.1, 0.25, 0.4]):
+                            try:
+                                values = self.__technique_values__(plan, col, technique, params)
+                            except:
+                                continue
+                            group_sizes = evaluator.group_sizes_with(col, values)
+                            kept = group_sizes[group_sizes >= k].sum() if k is not None else length
+                            estimate = (float(kept) / length) / (perturbation + cost)
+                            self.iter += 1
+                            candidate = (estimate, -discernibility(group_sizes, k), -self.iter,
+                                         (plan, evaluator, perturbation, used, col, technique, params, cost, values))
+                            if len(candidates) < beam_width:
+                                heapq.heappush(candidates, candidate)
+                            elif candidate[:3] > candidates[0][:3]:
+                                heapq.heapreplace(candidates, candidate)
+            beam = []
+            for _, _, _, (plan, evaluator, perturbation, used, col, technique, params, cost, values) in \
+                    sorted(candidates, reverse=True):
+                try:
+                    newPlan, newEvaluator, kept = self.__apply_technique__(plan, evaluator, col, technique, params,
+                                                                           values)
+                except:
+                    continue
+                utility = (float(kept) / length) / (perturbation + cost)
                 if utility > best_utility:
-                    best_df = dfResult
+                    best_plan = newPlan.filtered(newEvaluator.keep_mask())
                     best_utility = utility
-                if best_utility >= self.stop_utility:
-                    return best_df, best_utility
-            except:
-                pass
-        elif n == 5:
-            try:
-                num_groups = np.arange(0.1, 0.9, 0.2)
-                for num_group in num_groups:
-                    newDf = perturbation_micro_aggregation(df, col, num_group)
-                    dfResult = self.__achieve_klt__(newDf, k, l, t)
-                    utility = (float(len(dfResult)) / len(df)) / (perturbation + num_group)
-                    if utility > best_utility:
-                        best_df = dfResult
-                        best_utility = utility
-                    if best_utility >= self.stop_utility:
-                        return best_df, best_utility
-            except:
-                pass
-        return best_df, best_utility
+                beam.append((newPlan, newEvaluator, perturbation + cost, used + (col,)))
+        return self.__search_end__(best_plan, best_utility)
+
+    def __generalization_levels__(self, values, col):
+        """
+        Chain of generalization levels of a quasi-identifier, from the original values to the suppression
+        :return: list of (technique, params), None for the original values
+        """
+        levels = [None]
+        hierarchy = self.hierarchies.get(col)
+        if hierarchy is not None:
+            levels.extend(("generalization_hierarchy", (hierarchy, level)) for level in range(1, hierarchy.n_levels))
+        elif pd.api.types.is_numeric_dtype(values):
+            # The quantiles of each step are a subset of the quantiles of the previous one
+            levels.extend(("generalization_numerical_interval", (step,)) for step in [0.1, 0.2, 0.4])
+        else:
+            average_length_strings = int(values.astype(str).str.len().mean())
+            step = max(int(average_length_strings / 3), 1)
+            levels.extend(("generalization_mask", (num_mask,))
+                          for num_mask in np.arange(1, average_length_strings, step))
+        levels.append(("generalization_suppression", ()))
+        return levels
+
+    def achieve_klt_lattice(self, k, l, t, max_suppression=0.05):
+        """
+        Search the generalization lattice of the quasi-identifiers bottom-up, as in Incognito.
+        k and l are monotone (a generalization of a node that satisfies them satisfies them too), so they are used
+        to prune the lattice. The utility is not monotone (a higher node can keep more rows), so every satisfying
+        node is scored with k, l and t, in increasing perturbation until 1 / perturbation, the highest utility a
+        node can reach, is not above the best utility. The result is the satisfying node with the best utility.
+        Every node is grouped from the codes of its levels, computed once. self.lattice_evaluations counts the
+        nodes checked for k and l and the nodes scored.
+        :param max_suppression: fraction of rows that can be suppressed for a node to satisfy k and l
+        :return: (best_df, best_utility)
+        """
+        df = self._dataframeFinal
+        length = len(df)
+        plan = TransformationPlan(df)
+        levels = {}
+        values = {}
+        codes = {}
+        for col in self.quasi_identifiers_index:
+            levels[col] = self.__generalization_levels__(df[col], col)
+            values[col] = [df[col] if level is None else self.__technique_values__(plan, col, *level)
+                           for level in levels[col]]
+            codes[col] = [factorize_column(level_values) for level_values in values[col]]
+
+        sensitive_values = {col: np.asarray(df[col]) for col in self.sensible_index}
+        references = {}
+
+        def failing_groups(subset, node, t=None, max_failing=None):
+            """
+            :param max_failing: rows that can fail, the groups that fail k are enough to exceed it
+            :return: (group id of each row, size of each group, Boolean array with the groups that fail k-l-t)
+            """
+            group_ids, group_sizes = groups_from_codes([codes[col][level][0] for col, level in zip(subset, node)],
+                                                       [codes[col][level][1] for col, level in zip(subset, node)])
+            failing = np.zeros(len(group_sizes), dtype=bool)
+            if k is not None:
+                failing |= group_sizes < k
+                if max_failing is not None and group_sizes[failing].sum() > max_failing:
+                    return group_ids, group_sizes, failing
+            for col in self.sensible_index:
+                # A sensitive quasi-identifier is measured with its generalized values
+                level = dict(zip(subset, node)).get(col)
+                column = sensitive_values[col] if level is None else np.asarray(values[col][level])
+                if l is not None:
+                    pair_groups, pair_counts = group_value_counts(column, group_ids)
+                    failing |= ~l_diverse_groups(pair_groups, pair_counts, group_sizes, l, self.l_diversity, self.c)
+                if t is not None:
+                    if (col, level) not in references:
+                        references[(col, level)] = ClosenessReference(column)
+                    distances = t_closeness_distances(column, group_ids, group_sizes, references[(col, level)],
+                                                      self.t_distance)
+                    failing |= ~(distances >= t)
+            return group_ids, group_sizes, failing
+
+        def satisfies(subset, node):
+            _, group_sizes, failing = failing_groups(subset, node, max_failing=max_suppression * length)
+            return group_sizes[failing].sum() <= max_suppression * length
+
+        nodes, self.lattice_evaluations = incognito(self.quasi_identifiers_index,
+                                                    {col: len(levels[col]) for col in levels}, satisfies)
+        evaluator = self.__evaluator__(df, k, l, t)
+        best_plan = plan.filtered(evaluator.keep_mask())
+        best_utility = float(evaluator.kept_rows()) / length
+
+        top_levels = np.array([len(levels[col]) - 1 for col in self.quasi_identifiers_index], dtype=np.float64)
+        perturbations = 1.0 + (0.1 * nodes / top_levels).sum(axis=1)
+        # By increasing perturbation, then by levels
+        order = np.lexsort([nodes[:, i] for i in reversed(range(nodes.shape[1]))] + [perturbations])
+        for node, perturbation in zip(nodes[order], perturbations[order]):
+            node = tuple(int(level) for level in node)
+            if 1.0 / perturbation <= best_utility:
+                break
+            # The node is scored with k, l and t from the codes of its levels
+            self.lattice_evaluations += 1
+            group_ids, group_sizes, failing = failing_groups(self.quasi_identifiers_index, node, t)
+            utility = (float(group_sizes[~failing].sum()) / length) / perturbation
+            if utility > best_utility:
+                newPlan = plan
+                for col, level in zip(self.quasi_identifiers_index, node):
+                    if level > 0:
+                        technique, params = levels[col][level]
+                        newPlan = newPlan.extend(col, technique, params, values[col][level])
+                best_plan = newPlan.filtered(~failing[group_ids])
+                best_utility = utility
+        return self.__search_end__(best_plan, best_utility)
+
+    def achieve_k_mondrian(self, k, l=None, t=None):
+        """
+        Partition the rows top-down (Mondrian): every partition is split at the median of its widest
+        quasi-identifier while both halves achieve k, l and t, and the quasi-identifiers of each final partition
+        are generalized to its range or to its set of categories.
+        :return: (best_df, best_utility)
+        """
+        df = self._dataframeFinal
+        length = len(df)
+        columns = {col: ordered_values(df[col]) for col in self.quasi_identifiers_index}
+        sensitive_values = {col: np.asarray(df[col]) for col in self.sensible_index}
+        references = {}
+        if t is not None:
+            references = {col: ClosenessReference(sensitive_values[col]) for col in self.sensible_index}
+
+        def allowed(rows, left):
+            sides = left.astype(np.int64)
+            sizes = np.array([len(left) - sides.sum(), sides.sum()], dtype=np.int64)
+            if k is not None and sizes.min() < k:
+                return False
+            for col in self.sensible_index:
+                values = sensitive_values[col][rows]
+                if l is not None:
+                    pair_groups, pair_counts = group_value_counts(values, sides)
+                    if not l_diverse_groups(pair_groups, pair_counts, sizes, l, self.l_diversity, self.c).all():
+                        return False
+                if t is not None:
+                    distances = t_closeness_distances(values, sides, sizes, references[col], self.t_distance)
+                    if not (distances >= t).all():
+                        return False
+            return True
+
+        partition_ids, self.n_partitions = mondrian_partitions([columns[col][0] for col in columns], allowed)
+        plan = TransformationPlan(df)
+        perturbation = 1.0
+        for col, (ordered, numerical) in columns.items():
+            values = generalize_partitions(df[col], partition_ids, numerical, self.hierarchies.get(col))
+            plan = plan.extend(col, "mondrian", (), values)
+            perturbation += 0.1 * partition_widths(ordered, partition_ids).mean() if length else 0.0
+        # The whole dataframe can be a single partition that does not achieve k-l-t
+        evaluator = self.__evaluator__(plan.frame, k, l, t)
+        best_plan = plan.filtered(evaluator.keep_mask())
+        best_utility = (float(evaluator.kept_rows()) / length) / perturbation if length else 0.0
+        return self.__search_end__(best_plan, best_utility)
+
+    def achieve_k_mdav(self, k, l=None, t=None, chunk_size=None):
+        """
+        Micro-aggregate the numerical quasi-identifiers together with MDAV: every record gets the centroid of a
+        group of at least k close records. The groups that do not achieve k-l-t (because of the categorical
+        quasi-identifiers, l or t) are suppressed.
+        :param chunk_size: run MDAV on chunks of records to scale to large tables (see mdav_groups)
+        :return: (best_df, best_utility)
+        """
+        df = self._dataframeFinal
+        length = len(df)
+        plan = TransformationPlan(df)
+        numerical = [col for col in self.quasi_identifiers_index
+                     if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])]
+        perturbation = 1.0
+        if numerical and length:
+            original = pd.DataFrame({col: df[col] for col in numerical})
+            aggregated = perturbation_mdav(original, numerical, k, chunk_size)
+            for col in numerical:
+                plan = plan.extend(col, "perturbation_mdav", (k,), aggregated[col])
+            perturbation += information_loss(original.values, aggregated.values)
+        evaluator = self.__evaluator__(plan.frame, k, l, t)
+        best_plan = plan.filtered(evaluator.keep_mask())
+        best_utility = (float(evaluator.kept_rows()) / length) / perturbation if length else 0.0
+        return self.__search_end__(best_plan, best_utility)
 
     def integrate_arx(self):
         """
@@ -0,0 +1,31 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.techniques.pseudonymization import pseudonymization_encryption, revert_pseudonymization_encryption
+
+"""
+Throughput of the encryption of an identifier column, in rows per second
+usage: python benchmarkEncryption.py [rows] [distinct identifiers] [workers]
+"""
+rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+distinct = int(sys.argv[2]) if len(sys.argv) > 2 else rows // 20
+workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+rng = np.random.default_rng(0)
+dfOrigen = pd.DataFrame({"id": rng.integers(0, distinct, rows).astype(str)})
+print("%d rows, %d distinct identifiers, %d workers" % (rows, dfOrigen["id"].nunique(), workers))
+
+for deterministic in [False, True]:
+    for n_workers in [None, workers]:
+        start = time.perf_counter()
+        dfFinal = pseudonymization_encryption(dfOrigen, "id", deterministic, n_workers)
+        encryption = time.perf_counter() - start
+        start = time.perf_counter()
+        dfReversible = revert_pseudonymization_encryption(dfFinal, "id", deterministic, n_workers)
+        decryption = time.perf_counter() - start
+        assert dfReversible["id"].equals(dfOrigen["id"])
+        print("%-13s workers=%-4s encrypt %10.0f rows/s   decrypt %10.0f rows/s" %
+              ("deterministic" if deterministic else "fernet", n_workers or 1, rows / encryption, rows / decryption))
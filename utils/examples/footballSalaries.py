@@ -20,7 +20,7 @@ non_sensible = ["total_value", "avg_year", "total_guaranteed", "fully_guaranteed
 # dfOrigen = dfOrigen.sort_values(by='player', ascending=True)
 # print(dfOrigen)
 
-# RNG PRODUCE COLISIONES
+# RNG SIN COLISIONES
 # dfFinal, dfMapping = pseudonymization_rng(dfOrigen, identifiers[0])
 # dfOrigen = revert_pseudonymization_with_mapping_table(dfFinal, dfMapping, identifiers[0])
 # dfOrigen = dfOrigen.sort_values(by='player', ascending=True)
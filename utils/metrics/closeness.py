@@ -0,0 +1,110 @@
+##########################################
+# FUNCTIONS WITH T-CLOSENESS MEASURES    #
+##########################################
+
+"""
+The distance between the distribution of a sensitive column inside each group and its global distribution.
+The global column is sorted only once (ClosenessReference) and every group is measured in one vectorized pass
+over the rows sorted by (group, value).
+- ks: Kolmogorov-Smirnov statistic, the same value returned by scipy.stats.ks_2samp
+- emd: Earth Mover's Distance with the ordered distance over the sorted values of the global column
+"""
+import numpy as np
+
+T_CLOSENESS_DISTANCES = ["ks", "emd"]
+
+
+class ClosenessReference:
+    """
+    Global empirical CDF of a sensitive column
+    """
+
+    def __init__(self, values):
+        self.sorted_values = np.sort(np.asarray(values))
+        self.domain, counts = np.unique(self.sorted_values, return_counts=True)
+        self.cdf = np.cumsum(counts) / len(self.sorted_values)
+        self.cdf_sums = np.concatenate([[0.0], np.cumsum(self.cdf)])
+
+
+def __sort_groups__(values, group_ids, group_sizes):
+    """
+    Sort the rows by group and value
+    :return: (sorted values, sorted group ids, position of each row inside its group, first row of each group,
+    mask of the first row of each run of equal values, mask of the last row of each run of equal values)
+    """
+    values = np.asarray(values)
+    _, value_codes = np.unique(values, return_inverse=True)
+    order = np.lexsort((value_codes.ravel(), group_ids))
+    sorted_values = values[order]
+    sorted_groups = np.asarray(group_ids)[order]
+    sorted_codes = value_codes.ravel()[order]
+    starts = np.concatenate([[0], np.cumsum(group_sizes)[:-1]]).astype(np.int64)
+    position = np.arange(len(sorted_values)) - starts[sorted_groups]
+    first_run = np.ones(len(sorted_values), dtype=bool)
+    first_run[1:] = (sorted_groups[1:] != sorted_groups[:-1]) | (sorted_codes[1:] != sorted_codes[:-1])
+    last_run = np.ones(len(sorted_values), dtype=bool)
+    last_run[:-1] = first_run[1:]
+    return sorted_values, sorted_groups, position, starts, first_run, last_run
+
+
+def ks_distances(values, group_ids, group_sizes, reference):
+    """
+    Kolmogorov-Smirnov statistic between each group and the reference.
+    Between two consecutive values of a group its CDF is constant, so the supremum is reached
+    at a value of the group (right limits) or just before it (left limits).
+    :return: array with the statistic of each group
+    """
+    if len(group_sizes) == 0:
+        return np.zeros(0)
+    sorted_values, sorted_groups, position, starts, first_run, last_run = __sort_groups__(values, group_ids,
+                                                                                          group_sizes)
+    size = group_sizes[sorted_groups]
+    n = len(reference.sorted_values)
+    ref_right = np.searchsorted(reference.sorted_values, sorted_values, side="right") / n
+    ref_left = np.searchsorted(reference.sorted_values, sorted_values, side="left") / n
+    distance = np.zeros(len(sorted_values))
+    distance[last_run] = np.abs((position + 1) / size - ref_right)[last_run]
+    distance[first_run] = np.maximum(distance[first_run], np.abs(position / size - ref_left)[first_run])
+    return np.maximum.reduceat(distance, starts)
+
+
+def emd_distances(values, group_ids, group_sizes, reference):
+    """
+    Earth Mover's Distance with ordered distance between each group and the reference:
+    sum(|CDF group - CDF reference|) over the m sorted values of the reference, divided by m - 1.
+    The CDF of a group is constant between two of its values, so each segment is solved with prefix sums.
+    :return: array with the distance of each group
+    """
+    n_groups = len(group_sizes)
+    m = len(reference.domain)
+    if n_groups == 0 or m < 2:
+        return np.zeros(n_groups)
+    sorted_values, sorted_groups, position, starts, first_run, last_run = __sort_groups__(values, group_ids,
+                                                                                          group_sizes)
+    # One segment per run of equal values: the CDF of the group is constant from the value to the next one
+    seg_groups = sorted_groups[last_run]
+    seg_cdf = ((position + 1) / group_sizes[sorted_groups])[last_run]
+    seg_low = np.searchsorted(reference.domain, sorted_values[last_run], side="left")
+    seg_high = np.append(seg_low[1:], m)
+    seg_high[np.append(seg_groups[1:] != seg_groups[:-1], True)] = m
+    split = np.clip(np.searchsorted(reference.cdf, seg_cdf, side="left"), seg_low, seg_high)
+    sums = reference.cdf_sums
+    seg_distance = seg_cdf * (split - seg_low) - (sums[split] - sums[seg_low]) \
+        + (sums[seg_high] - sums[split]) - seg_cdf * (seg_high - split)
+    distance = np.bincount(seg_groups, weights=seg_distance, minlength=n_groups)
+    # Before the first value of the group its CDF is 0
+    first_low = seg_low[np.searchsorted(seg_groups, np.arange(n_groups))]
+    distance += sums[first_low]
+    return distance / (m - 1)
+
+
+def t_closeness_distances(values, group_ids, group_sizes, reference, distance="ks"):
+    """
+    :param distance: "ks" or "emd"
+    :return: array with the distance between each group and the reference
+    """
+    if distance == "ks":
+        return ks_distances(values, group_ids, group_sizes, reference)
+    if distance == "emd":
+        return emd_distances(values, group_ids, group_sizes, reference)
+    raise ValueError("Unknown t-closeness distance: " + str(distance))
@@ -0,0 +1,82 @@
+##########################################
+# FUNCTIONS WITH L-DIVERSITY MEASURES    #
+##########################################
+
+"""
+All the measures are computed from the same grouped value counts of a sensitive column:
+for each group, how many times each sensitive value appears, sorted from the most to the least frequent.
+- Distinct l-diversity: number of different sensitive values in the group
+- Entropy l-diversity: exp(entropy of the sensitive values in the group)
+- Recursive (c,l)-diversity: r1 < c * (rl + ... + rm), where ri is the count of the i-th most frequent value
+"""
+import numpy as np
+
+from utils.metrics.grouping import factorize_column, unique_keys
+
+L_DIVERSITY_VARIANTS = ["distinct", "entropy", "recursive"]
+
+
+def group_value_counts(values, group_ids):
+    """
+    Count the occurrences of each value inside each group
+    :param values: sensitive values of each row
+    :param group_ids: group id of each row
+    :return: (pair_groups, pair_counts) one entry per (group, value) sorted by group and by descending count
+    """
+    codes, cardinality = factorize_column(values)
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    n_groups = int(group_ids.max()) + 1 if len(group_ids) else 0
+    keys, _, pair_counts = unique_keys(group_ids * cardinality + codes, n_groups * cardinality)
+    pair_groups = keys // cardinality
+    order = np.lexsort((-pair_counts, pair_groups))
+    return pair_groups[order], pair_counts[order]
+
+
+def distinct_l_diversity(pair_groups, pair_counts, group_sizes):
+    """
+    :return: number of different values of each group
+    """
+    return np.bincount(pair_groups, minlength=len(group_sizes))
+
+
+def entropy_l_diversity(pair_groups, pair_counts, group_sizes):
+    """
+    :return: exp(entropy) of each group, the l reached by the group in entropy l-diversity
+    """
+    p = pair_counts / group_sizes[pair_groups]
+    entropy = -np.bincount(pair_groups, weights=p * np.log(p), minlength=len(group_sizes))
+    return np.exp(entropy)
+
+
+def recursive_cl_diversity(pair_groups, pair_counts, group_sizes, c, l):
+    """
+    :param c: c property
+    :param l: l property
+    :return: Boolean array, True for the groups with recursive (c,l)-diversity
+    """
+    n_groups = len(group_sizes)
+    starts = np.searchsorted(pair_groups, np.arange(n_groups))
+    rank = np.arange(len(pair_groups)) - starts[pair_groups]
+    most_frequent = pair_counts[starts]
+    tail = np.bincount(pair_groups, weights=pair_counts * (rank >= l - 1), minlength=n_groups)
+    distinct = np.bincount(pair_groups, minlength=n_groups)
+    return (distinct >= l) & (most_frequent < c * tail)
+
+
+def l_diverse_groups(pair_groups, pair_counts, group_sizes, l, variant="distinct", c=None):
+    """
+    Check which groups have l-diversity
+    :param variant: "distinct", "entropy" or "recursive"
+    :param c: c property, only for the recursive variant
+    :return: Boolean array with one value per group
+    """
+    if variant == "distinct":
+        return distinct_l_diversity(pair_groups, pair_counts, group_sizes) >= l
+    if variant == "entropy":
+        # Small tolerance so that uniform groups with exactly l values are accepted
+        return entropy_l_diversity(pair_groups, pair_counts, group_sizes) >= l - 1e-9
+    if variant == "recursive":
+        if c is None:
+            raise ValueError("Recursive (c,l)-diversity needs a value for c")
+        return recursive_cl_diversity(pair_groups, pair_counts, group_sizes, c, l)
+    raise ValueError("Unknown l-diversity variant: " + str(variant))
@@ -0,0 +1,109 @@
+##########################################
+# FUNCTIONS TO BUILD EQUIVALENCE CLASSES #
+##########################################
+
+"""
+An equivalence class (group) is the set of rows sharing the same values in every quasi-identifier.
+Groups are identified by integer ids: each quasi-identifier column is factorized into integer codes
+and the codes of all the columns are combined into one key per row, so no string concatenation is needed
+and values like ("1", "23") and ("12", "3") never collide.
+"""
+import numpy as np
+import pandas as pd
+
+
+def factorize_column(values):
+    """
+    Encode a column as dense integer codes. Missing values get their own code.
+    :param values: Series or array with the values of the column
+    :return: (codes, number of distinct codes)
+    """
+    codes, uniques = pd.factorize(values)
+    codes = codes.astype(np.int64) + 1  # Missing values (-1) become code 0
+    return codes, len(uniques) + 1
+
+
+def combine_codes(codes_list, cardinalities):
+    """
+    Combine several code arrays into a single key per row (mixed radix). Whenever the key space could
+    overflow int64 the partial key is compacted with np.unique before going on.
+    :param codes_list: list of integer code arrays with the same length
+    :param cardinalities: number of distinct codes of each array
+    :return: array of int64 keys
+    """
+    limit = np.iinfo(np.int64).max
+    key = np.zeros(len(codes_list[0]) if codes_list else 0, dtype=np.int64)
+    key_cardinality = 1
+    for codes, cardinality in zip(codes_list, cardinalities):
+        if key_cardinality > limit // max(cardinality, 1):
+            uniques, key = np.unique(key, return_inverse=True)
+            key = key.astype(np.int64).ravel()
+            key_cardinality = len(uniques)
+        key = key * cardinality + codes
+        key_cardinality *= cardinality
+    return key
+
+
+def generate_groups(dataframe, quasi_identifiers_index):
+    """
+    Generate the equivalence classes of a dataframe
+    :param dataframe: dataframe to group
+    :param quasi_identifiers_index: column index of quasi_identifiers
+    :return: (group_ids, group_sizes)
+    - group_ids: array with the group id (0..n_groups-1) of each row, in positional order
+    - group_sizes: array with the number of rows of each group
+    """
+    codes_list = []
+    cardinalities = []
+    for col in quasi_identifiers_index:
+        codes, cardinality = factorize_column(dataframe[col])
+        codes_list.append(codes)
+        cardinalities.append(cardinality)
+    if not codes_list:
+        # Without quasi-identifiers the whole dataframe is a single group
+        group_ids = np.zeros(len(dataframe), dtype=np.int64)
+        group_sizes = np.array([len(dataframe)], dtype=np.int64) if len(dataframe) else np.zeros(0, dtype=np.int64)
+        return group_ids, group_sizes
+    return groups_from_codes(codes_list, cardinalities)
+
+
+def groups_from_codes(codes_list, cardinalities):
+    """
+    Generate the equivalence classes from the codes of the quasi-identifiers
+    :param codes_list: list of integer code arrays, one per quasi-identifier
+    :param cardinalities: number of distinct codes of each array
+    :return: (group_ids, group_sizes)
+    """
+    key = combine_codes(codes_list, cardinalities)
+    _, group_ids, group_sizes = unique_keys(key, int(np.prod([int(c) for c in cardinalities], dtype=object)))
+    return group_ids, group_sizes
+
+
+def unique_keys(key, key_cardinality=None):
+    """
+    np.unique(key, return_inverse=True, return_counts=True) of non-negative integer keys. When every key is below
+    a small key_cardinality the keys are counted with np.bincount instead of sorted.
+    :return: (sorted distinct keys, id of the distinct key of each row, number of rows of each distinct key)
+    """
+    if key_cardinality is not None and key_cardinality <= 4 * len(key) + 1024:
+        counts = np.bincount(key, minlength=key_cardinality)
+        uniques = np.flatnonzero(counts)
+        ids = np.zeros(key_cardinality, dtype=np.int64)
+        ids[uniques] = np.arange(len(uniques))
+        return uniques, ids[key], counts[uniques].astype(np.int64)
+    uniques, ids, counts = np.unique(key, return_inverse=True, return_counts=True)
+    return uniques, ids.astype(np.int64).ravel(), counts.astype(np.int64)
+
+
+def discernibility(group_sizes, k=None):
+    """
+    Discernibility metric: each row costs the size of its group, and each row suppressed because its group is
+    smaller than k costs the number of rows
+    :return: int
+    """
+    group_sizes = np.asarray(group_sizes, dtype=np.int64)
+    length = int(group_sizes.sum())
+    if k is None:
+        return int((group_sizes ** 2).sum())
+    kept = group_sizes >= k
+    return int((group_sizes[kept] ** 2).sum()) + length * int(group_sizes[~kept].sum())
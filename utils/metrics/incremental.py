@@ -0,0 +1,278 @@
+##########################################
+# INCREMENTAL EVALUATION OF K-L-T        #
+##########################################
+
+"""
+Keep the groups of a dataframe and, for each group, whether it achieves k-anonymity, l-diversity and t-closeness.
+When a new dataframe only changes one column, the evaluator of the new dataframe is derived from the previous one:
+- A quasi-identifier changes: only the groups with changed rows, and the groups they merge into, are rebuilt
+- A sensitive column changes: the grouping is kept and only the l/t summaries of that column are updated
+"""
+import sys
+
+import numpy as np
+
+from utils.metrics.grouping import factorize_column, combine_codes, groups_from_codes
+from utils.metrics.diversity import group_value_counts, l_diverse_groups
+from utils.metrics.closeness import ClosenessReference, t_closeness_distances
+
+
+def changed_rows(old_values, new_values):
+    """
+    :return: Boolean array, True for the rows whose value is different (or not comparable)
+    """
+    old_values = np.asarray(old_values)
+    new_values = np.asarray(new_values)
+    try:
+        changed = np.asarray(old_values != new_values)
+    except (TypeError, ValueError):
+        changed = None
+    if changed is None or changed.shape != old_values.shape:
+        return np.ones(len(old_values), dtype=bool)
+    return changed
+
+
+def array_bytes(array):
+    """
+    Bytes of an array. The objects of an object array are estimated from a sample of them, counting once the
+    objects shared by several rows (as the intervals of a Categorical).
+    """
+    nbytes = array.nbytes
+    if array.dtype == object and len(array):
+        sample = array[::max(len(array) // 1000, 1)]
+        distinct = {id(value): value for value in sample}
+        nbytes += int(sum(sys.getsizeof(value) for value in distinct.values()) * len(array) / len(sample))
+    return nbytes
+
+
+class IncrementalEvaluator:
+    def __init__(self, dataframe, quasi_identifiers_index, sensible_index, k=None, l=None, t=None,
+                 l_diversity="distinct", c=None, t_distance="ks"):
+        """
+        :param dataframe: dataframe to evaluate
+        :param k: k property (None to ignore it)
+        :param l: l property (None to ignore it)
+        :param t: t property (None to ignore it)
+        """
+        self.quasi_identifiers_index = quasi_identifiers_index
+        self.sensible_index = sensible_index
+        self.k = k
+        self.l = l
+        self.t = t
+        self.l_diversity = l_diversity
+        self.c = c
+        self.t_distance = t_distance
+        self.length = len(dataframe)
+        self.columns = {}
+        for col in list(quasi_identifiers_index) + list(sensible_index):
+            self.columns[col] = np.asarray(dataframe[col])
+        self.codes = {col: factorize_column(self.columns[col]) for col in quasi_identifiers_index}
+        self.rest_keys = {}
+        self.references = {}
+        if t is not None:
+            for col in sensible_index:
+                self.references[col] = ClosenessReference(self.columns[col])
+        if quasi_identifiers_index:
+            codes_list = [self.codes[col][0] for col in quasi_identifiers_index]
+            cardinalities = [self.codes[col][1] for col in quasi_identifiers_index]
+            self.group_ids, self.group_sizes = groups_from_codes(codes_list, cardinalities)
+        else:
+            self.group_ids = np.zeros(self.length, dtype=np.int64)
+            self.group_sizes = np.array([self.length] if self.length else [], dtype=np.int64)
+        self.l_pass = {}
+        self.t_pass = {}
+        for col in sensible_index:
+            self.l_pass[col], self.t_pass[col] = self.__group_summaries__(col, np.ones(self.length, dtype=bool),
+                                                                          self.group_ids, self.group_sizes)
+        self.keep_groups = None
+        # Columns whose arrays (values, codes and reference) belong to this evaluator and no other
+        self.owned = set(self.columns)
+
+    def __group_summaries__(self, col, rows, group_ids, group_sizes):
+        """
+        l-diversity and t-closeness of some groups for a sensitive column
+        :param rows: Boolean array with the rows of the groups
+        :param group_ids: group id (0..len(group_sizes)-1) of each selected row
+        :return: (l_pass, t_pass) Boolean arrays with one value per group, or None when l or t are not used
+        """
+        values = self.columns[col][rows]
+        l_pass = None
+        t_pass = None
+        if self.l is not None:
+            pair_groups, pair_counts = group_value_counts(values, group_ids)
+            l_pass = l_diverse_groups(pair_groups, pair_counts, group_sizes, self.l, self.l_diversity, self.c)
+        if self.t is not None:
+            distances = t_closeness_distances(values, group_ids, group_sizes, self.references[col], self.t_distance)
+            t_pass = distances >= self.t
+        return l_pass, t_pass
+
+    def __rest_key__(self, col):
+        """
+        Dense key of the quasi-identifiers except col, cached because it does not change while col is replaced
+        """
+        if col not in self.rest_keys:
+            others = [other for other in self.quasi_identifiers_index if other != col]
+            if others:
+                key = combine_codes([self.codes[other][0] for other in others],
+                                    [self.codes[other][1] for other in others])
+                uniques, key = np.unique(key, return_inverse=True)
+                self.rest_keys[col] = (key.astype(np.int64).ravel(), len(uniques))
+            else:
+                self.rest_keys[col] = (np.zeros(self.length, dtype=np.int64), 1)
+        return self.rest_keys[col]
+
+    def __copy__(self):
+        evaluator = IncrementalEvaluator.__new__(IncrementalEvaluator)
+        evaluator.__dict__.update(self.__dict__)
+        evaluator.columns = dict(self.columns)
+        evaluator.codes = dict(self.codes)
+        evaluator.rest_keys = {}
+        evaluator.references = dict(self.references)
+        evaluator.l_pass = dict(self.l_pass)
+        evaluator.t_pass = dict(self.t_pass)
+        evaluator.keep_groups = None
+        evaluator.owned = set()
+        return evaluator
+
+    def replace_column(self, col, values):
+        """
+        Evaluator of the same dataframe with the values of col replaced. The rows must keep their order.
+        :param col: column index
+        :param values: new values of the column
+        :return: IncrementalEvaluator
+        """
+        if col not in self.columns:
+            return self
+        values = np.asarray(values)
+        changed = changed_rows(self.columns[col], values)
+        if not changed.any():
+            return self
+        evaluator = self.__copy__()
+        evaluator.columns[col] = values
+        evaluator.owned.add(col)
+        reference_changed = False
+        if col in self.sensible_index and self.t is not None:
+            reference = ClosenessReference(values)
+            previous = self.references[col]
+            reference_changed = len(reference.sorted_values) != len(previous.sorted_values) or \
+                bool(changed_rows(previous.sorted_values, reference.sorted_values).any())
+            evaluator.references[col] = reference
+        if col in self.quasi_identifiers_index:
+            rest_key = self.__rest_key__(col)
+            evaluator.rest_keys[col] = rest_key
+            evaluator.__regroup__(col, rest_key, changed)
+        elif col in self.sensible_index:
+            evaluator.__update_sensitive__(col, changed)
+        if reference_changed:
+            # The global distribution has changed, so every group has to be measured again
+            l_pass, t_pass = evaluator.__group_summaries__(col, np.ones(self.length, dtype=bool),
+                                                           evaluator.group_ids, evaluator.group_sizes)
+            evaluator.t_pass[col] = t_pass
+        return evaluator
+
+    def group_sizes_with(self, col, values):
+        """
+        Sizes of the groups of the same dataframe with the values of col replaced, without the l/t summaries.
+        It is a cheap estimate of the new grouping.
+        :return: array with the number of rows of each group
+        """
+        if col not in self.quasi_identifiers_index:
+            return self.group_sizes
+        rest, rest_cardinality = self.__rest_key__(col)
+        codes, cardinality = factorize_column(np.asarray(values))
+        _, group_sizes = np.unique(rest * cardinality + codes, return_counts=True)
+        return group_sizes.astype(np.int64)
+
+    def __regroup__(self, col, rest_key, changed):
+        """
+        Rebuild only the groups affected by the new values of the quasi-identifier col
+        """
+        codes, cardinality = factorize_column(self.columns[col])
+        self.codes[col] = (codes, cardinality)
+        rest, rest_cardinality = rest_key
+        key = rest * cardinality + codes
+        old_ids = self.group_ids
+        affected = np.zeros(len(self.group_sizes), dtype=bool)
+        affected[old_ids[changed]] = True
+        # Unchanged rows whose key is reached by a changed row are merged with it
+        landing = np.isin(key[~changed], key[changed])
+        affected[old_ids[~changed][landing]] = True
+        affected_rows = affected[old_ids]
+
+        kept_ids = np.flatnonzero(~affected)
+        remap = np.full(len(self.group_sizes), -1, dtype=np.int64)
+        remap[kept_ids] = np.arange(len(kept_ids))
+        _, local_ids, local_sizes = np.unique(key[affected_rows], return_inverse=True, return_counts=True)
+        local_ids = local_ids.astype(np.int64).ravel()
+        group_ids = remap[old_ids]
+        group_ids[affected_rows] = len(kept_ids) + local_ids
+        self.group_ids = group_ids
+        self.group_sizes = np.concatenate([self.group_sizes[kept_ids], local_sizes]).astype(np.int64)
+        for sensitive in self.sensible_index:
+            l_pass, t_pass = self.__group_summaries__(sensitive, affected_rows, local_ids, local_sizes)
+            if l_pass is not None:
+                self.l_pass[sensitive] = np.concatenate([self.l_pass[sensitive][kept_ids], l_pass])
+            if t_pass is not None:
+                self.t_pass[sensitive] = np.concatenate([self.t_pass[sensitive][kept_ids], t_pass])
+
+    def __update_sensitive__(self, col, changed):
+        """
+        Update the l/t summaries of the groups with changed rows in the sensitive column col
+        """
+        affected = np.zeros(len(self.group_sizes), dtype=bool)
+        affected[self.group_ids[changed]] = True
+        affected_rows = affected[self.group_ids]
+        affected_ids = np.flatnonzero(affected)
+        local = np.full(len(self.group_sizes), -1, dtype=np.int64)
+        local[affected_ids] = np.arange(len(affected_ids))
+        l_pass, t_pass = self.__group_summaries__(col, affected_rows, local[self.group_ids[affected_rows]],
+                                                  self.group_sizes[affected_ids])
+        if l_pass is not None:
+            self.l_pass[col] = self.l_pass[col].copy()
+            self.l_pass[col][affected_ids] = l_pass
+        if t_pass is not None:
+            self.t_pass[col] = self.t_pass[col].copy()
+            self.t_pass[col][affected_ids] = t_pass
+
+    def memory_usage(self):
+        """
+        Approximate bytes used by the arrays of this evaluator: the groups, the l/t summaries and the values,
+        codes and closeness reference of the columns it replaced (the others are shared with its parent)
+        """
+        arrays = [self.group_ids, self.group_sizes] + list(self.l_pass.values()) + list(self.t_pass.values())
+        for col in self.owned:
+            arrays.append(self.columns[col])
+            if col in self.codes:
+                arrays.append(self.codes[col][0])
+            if col in self.references:
+                reference = self.references[col]
+                arrays += [reference.sorted_values, reference.domain, reference.cdf, reference.cdf_sums]
+        return int(sum(array_bytes(array) for array in arrays if array is not None))
+
+    def groups_achieved(self):
+        """
+        :return: Boolean array, True for the groups that achieve k, l and t
+        """
+        if self.keep_groups is None:
+            keep_groups = np.ones(len(self.group_sizes), dtype=bool)
+            if self.k is not None:
+                keep_groups &= self.group_sizes >= self.k
+            for col in self.sensible_index:
+                if self.l is not None:
+                    keep_groups &= self.l_pass[col]
+                if self.t is not None:
+                    keep_groups &= self.t_pass[col]
+            self.keep_groups = keep_groups
+        return self.keep_groups
+
+    def keep_mask(self):
+        """
+        :return: Boolean array, True for the rows whose group achieves k, l and t
+        """
+        return self.groups_achieved()[self.group_ids]
+
+    def kept_rows(self):
+        """
+        :return: number of rows whose group achieves k, l and t
+        """
+        return int(self.group_sizes[self.groups_achieved()].sum())
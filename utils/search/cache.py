@@ -0,0 +1,106 @@
+##########################################
+# MEMOIZATION OF TECHNIQUE RESULTS       #
+##########################################
+
+"""
+Bounded LRU cache for the search. The entries are keyed by the fingerprint of the column state plus the
+technique and its params, so the same transformation is not recomputed in sibling branches of the
+backtracking or in repeated iterations of the random search.
+- The fingerprint of a column of the original dataframe is a hash of its content
+- The fingerprint of a column produced by a deterministic technique is derived from the fingerprint of its
+input, the technique and the params. Random techniques get a new fingerprint each time and are never cached.
+"""
+import hashlib
+import itertools
+from collections import OrderedDict
+
+import pandas as pd
+
+DETERMINISTIC_TECHNIQUES = ["generalization_categorical_semantic", "generalization_numerical_interval",
+                            "generalization_mask", "generalization_hierarchy", "generalization_suppression",
+                            "perturbation_micro_aggregation"]
+
+__random_fingerprints__ = itertools.count()
+
+
+def column_fingerprint(values):
+    """
+    Hash of the content of a column
+    :param values: Series
+    :return: str
+    """
+    try:
+        hashes = pd.util.hash_pandas_object(values, index=False)
+    except TypeError:
+        hashes = pd.util.hash_pandas_object(values.astype(str), index=False)
+    return hashlib.blake2b(hashes.values.tobytes() + str(values.dtype).encode(), digest_size=16).hexdigest()
+
+
+def derived_fingerprint(fingerprint, technique, params):
+    """
+    Fingerprint of the column produced by applying a technique to a column
+    :param fingerprint: fingerprint of the input column
+    :return: str
+    """
+    if technique not in DETERMINISTIC_TECHNIQUES or is_random_fingerprint(fingerprint):
+        # A column derived from a random column is as unrepeatable as it
+        return "random-" + str(next(__random_fingerprints__))
+    return hashlib.blake2b((fingerprint + technique + repr(params)).encode(), digest_size=16).hexdigest()
+
+
+def is_random_fingerprint(fingerprint):
+    """
+    :return: True if the column comes from a random technique, so its fingerprint is never seen again and the
+    entries keyed by it can never be hit
+    """
+    return fingerprint.startswith("random-")
+
+
+class TechniqueCache:
+    def __init__(self, max_entries=1024, max_bytes=256 * 1024 * 1024):
+        """
+        :param max_entries: maximum number of entries
+        :param max_bytes: memory cap in bytes for the stored values
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        :return: the cached value, or None if the key is not in the cache
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, value, nbytes):
+        """
+        Store a value, evicting the least recently used entries to stay under the limits
+        :param nbytes: memory used by the value
+        """
+        if nbytes > self.max_bytes or self.max_entries <= 0:
+            return
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, nbytes)
+        self.bytes += nbytes
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self.entries.popitem(last=False)
+            self.bytes -= evicted_bytes
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def info(self):
+        """
+        :return: dict with hits, misses, entries and bytes
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.bytes}
@@ -0,0 +1,62 @@
+##########################################
+# GENERALIZATION LATTICE (INCOGNITO)     #
+##########################################
+
+"""
+Each quasi-identifier has a chain of generalization levels, from level 0 (original values) to the top level
+(every value suppressed). A node of the lattice chooses one level for each quasi-identifier.
+The search uses two monotonicity properties:
+- If a node satisfies the constraints, every generalization of it (every node with higher or equal levels)
+satisfies them too, so only the nodes above no satisfying node are evaluated, from the bottom up.
+- If a node satisfies the constraints for a set of quasi-identifiers, its projection satisfies them for every
+subset, so, as in Incognito, the subsets are searched before the supersets and a node is only a candidate
+if all its projections on the subsets with one quasi-identifier less are satisfying.
+"""
+import itertools
+
+import numpy as np
+
+
+def incognito(columns, n_levels, satisfies):
+    """
+    Find all the nodes of the lattice that satisfy the constraints.
+    The nodes of each subset of quasi-identifiers are a dense Boolean grid with one axis per column, visited by
+    increasing sum of levels: a candidate with a satisfying node one level below it is satisfying without being
+    evaluated, so only the candidates above no satisfying node call satisfies.
+    :param columns: list of quasi-identifiers
+    :param n_levels: dict {column: number of levels}
+    :param satisfies: function(subset, node) -> Boolean, with subset a tuple of columns and node a tuple of levels
+    :return: (array with one row of levels per satisfying node for all the columns, number of evaluated nodes)
+    """
+    satisfying = {(): np.ones((), dtype=bool)}
+    evaluations = 0
+    for size in range(1, len(columns) + 1):
+        next_satisfying = {}
+        for subset in itertools.combinations(columns, size):
+            shape = tuple(n_levels[col] for col in subset)
+            # Every projection of a satisfying node is satisfying
+            candidates = np.ones(shape, dtype=bool)
+            for i in range(size):
+                candidates &= np.expand_dims(satisfying[subset[:i] + subset[i + 1:]], i)
+            found = np.zeros(shape, dtype=bool)
+            nodes = np.flatnonzero(candidates)
+            levels = np.array(np.unravel_index(nodes, shape)).T
+            sums = levels.sum(axis=1)
+            strides = np.array([int(np.prod(shape[i + 1:])) for i in range(size)], dtype=np.int64)
+            flat = found.reshape(-1)
+            for total in np.unique(sums):
+                layer = sums == total
+                layer_nodes, layer_levels = nodes[layer], levels[layer]
+                # A node above a satisfying node is one level above a satisfying candidate of the previous layers
+                above = np.zeros(len(layer_nodes), dtype=bool)
+                for i in range(size):
+                    below = layer_levels[:, i] > 0
+                    above[below] |= flat[layer_nodes[below] - strides[i]]
+                flat[layer_nodes[above]] = True
+                for node, node_levels in zip(layer_nodes[~above], layer_levels[~above]):
+                    evaluations += 1
+                    if satisfies(subset, tuple(int(level) for level in node_levels)):
+                        flat[node] = True
+            next_satisfying[subset] = found
+        satisfying = next_satisfying
+    return np.argwhere(satisfying.get(tuple(columns), np.zeros(0, dtype=bool))), evaluations
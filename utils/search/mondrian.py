@@ -0,0 +1,126 @@
+##########################################
+# MONDRIAN MULTIDIMENSIONAL PARTITIONING #
+##########################################
+
+"""
+Top-down partitioning of the rows (Mondrian): a partition is split at the median of its widest
+quasi-identifier while both halves satisfy the constraints, and every final partition becomes one group whose
+quasi-identifiers are generalized to the range (numerical) or the set of categories (categorical) of its rows.
+Each level of the recursion works on disjoint partitions with a linear-time median, so the whole
+partitioning is O(n log n).
+The widths are normalized by the width of the whole column, so the columns are comparable:
+- Numerical column: max - min of the partition
+- Categorical column: the categories are sorted, and the width is the range of their positions
+"""
+import numpy as np
+import pandas as pd
+
+
+def ordered_values(values):
+    """
+    Values of a quasi-identifier as an ordered numeric array
+    :param values: Series with the values of the column
+    :return: (array of floats, True if the column is numerical)
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values) and \
+            not values.isna().any():
+        return np.asarray(values, dtype=np.float64), True
+    try:
+        codes, _ = pd.factorize(values, sort=True)
+    except TypeError:
+        codes, _ = pd.factorize(values)
+    return codes.astype(np.float64), False
+
+
+def median_split(values):
+    """
+    Split some values at their median
+    :return: Boolean array, True for the values of the left half, or None if the values can not be split
+    """
+    median = np.median(values)
+    left = values <= median
+    if left.all():
+        left = values < median
+    if not left.any() or left.all():
+        return None
+    return left
+
+
+def mondrian_partitions(columns, allowed):
+    """
+    Partition the rows
+    :param columns: list of ordered arrays (see ordered_values), one per quasi-identifier
+    :param allowed: function(rows, left) -> Boolean, True if both halves of the split of the rows satisfy the
+    constraints, with rows the positions of the partition and left the Boolean mask of the left half
+    :return: (partition id of each row, number of partitions)
+    """
+    length = len(columns[0]) if columns else 0
+    partition_ids = np.zeros(length, dtype=np.int64)
+    if length == 0:
+        return partition_ids, 0
+    spans = [float(column.max() - column.min()) for column in columns]
+    n_partitions = 0
+    stack = [np.arange(length)]
+    while stack:
+        rows = stack.pop()
+        widths = np.array([(column[rows].max() - column[rows].min()) / span if span > 0 else 0.0
+                           for column, span in zip(columns, spans)])
+        split = False
+        for dim in np.argsort(-widths, kind="stable"):
+            if widths[dim] == 0:
+                break
+            left = median_split(columns[dim][rows])
+            if left is not None and allowed(rows, left):
+                stack.append(rows[~left])
+                stack.append(rows[left])
+                split = True
+                break
+        if not split:
+            partition_ids[rows] = n_partitions
+            n_partitions += 1
+    return partition_ids, n_partitions
+
+
+def partition_widths(column, partition_ids):
+    """
+    Normalized width of the partition of each row (normalized certainty penalty)
+    :return: array of floats between 0 and 1
+    """
+    span = float(column.max() - column.min()) if len(column) else 0.0
+    if span == 0:
+        return np.zeros(len(column))
+    bounds = pd.Series(column).groupby(partition_ids).agg(["min", "max"])
+    widths = ((bounds["max"] - bounds["min"]) / span).values
+    return widths[partition_ids]
+
+
+def generalize_partitions(values, partition_ids, numerical, hierarchy=None):
+    """
+    Generalize the values of a quasi-identifier to the partitions
+    :param values: Series with the values of the column
+    :param numerical: True to generalize to the closed intervals [min, max] of the partitions
+    :param hierarchy: Hierarchy of the column, the partitions are named by the lowest label shared by their values
+    :return: Series with the same index
+    """
+    if numerical:
+        bounds = pd.Series(np.asarray(values)).groupby(partition_ids).agg(["min", "max"])
+        intervals = pd.IntervalIndex.from_arrays(bounds["min"].values, bounds["max"].values, closed="both")
+        # Categorical of intervals, as returned by pd.cut in generalization_numerical_interval
+        codes, uniques = pd.factorize(intervals)
+        return pd.Series(pd.Categorical.from_codes(codes[partition_ids], uniques), index=values.index,
+                         name=values.name)
+    codes, uniques = pd.factorize(values)
+    pairs = pd.DataFrame({"partition": partition_ids, "code": codes}).drop_duplicates()
+    n_values = pairs.groupby("partition")["code"].transform("size").values
+    if (n_values == 1).all():
+        return values.copy()
+    # Only the partitions with several values are named, the others keep their value
+    labels = {}
+    for partition, partition_codes in pairs[n_values > 1].groupby("partition")["code"]:
+        names = sorted(str(uniques[code]) if code >= 0 else str(np.nan) for code in partition_codes)
+        label = hierarchy.common_label(pd.Series(names)) if hierarchy is not None else None
+        labels[partition] = label if label is not None else "{" + ", ".join(names) + "}"
+    result = values.astype(object)
+    mixed = np.isin(partition_ids, list(labels))
+    result[mixed] = pd.Series(partition_ids[mixed]).map(labels).values
+    return result
@@ -0,0 +1,96 @@
+##########################################
+# COPY-ON-WRITE COLUMN OVERLAYS          #
+##########################################
+
+"""
+A column overlay behaves like a read-only dataframe built from a base dataframe: the unchanged columns are
+shared by reference with the base and only the replaced columns are stored in the overlay.
+Replacing a column never modifies the base or the columns of other overlays, so copying an overlay is free
+and the search can keep one overlay per candidate with a single copy of the data in memory.
+"""
+import numpy as np
+import pandas as pd
+
+
+class ColumnOverlay:
+    def __init__(self, base, columns=None):
+        """
+        :param base: base dataframe (or another overlay, whose replaced columns are inherited)
+        :param columns: dict {column: Series} with the replaced columns
+        """
+        if isinstance(base, ColumnOverlay):
+            replaced = dict(base.replaced)
+            replaced.update(columns or {})
+            base = base.base
+        else:
+            replaced = dict(columns or {})
+        self.base = base
+        self.replaced = replaced
+
+    @property
+    def columns(self):
+        return self.base.columns
+
+    @property
+    def index(self):
+        return self.base.index
+
+    @property
+    def shape(self):
+        return self.base.shape
+
+    def __len__(self):
+        return len(self.base)
+
+    def __contains__(self, col):
+        return col in self.base.columns
+
+    def __getitem__(self, key):
+        """
+        :param key: a column index, a list of column indexes, or a Boolean array to materialize only some rows
+        """
+        if isinstance(key, (np.ndarray, pd.Series)) and key.dtype == bool:
+            if len(key) != len(self.base):
+                raise ValueError("Boolean mask of %d rows for %d rows" % (len(key), len(self.base)))
+            return self.to_dataframe(np.asarray(key))
+        if isinstance(key, list):
+            return pd.DataFrame({col: self[col] for col in key}, index=self.base.index, columns=key)
+        if key in self.replaced:
+            return self.replaced[key]
+        return self.base[key]
+
+    def __setitem__(self, col, values):
+        if not isinstance(values, pd.Series):
+            values = pd.Series(values, index=self.base.index, name=col)
+        self.replaced[col] = values
+
+    def copy(self, deep=True):
+        """
+        Copy of the overlay. The columns are shared, never copied: a column is only ever replaced, not modified.
+        """
+        return ColumnOverlay(self.base, self.replaced)
+
+    def with_column(self, col, values):
+        """
+        :return: new overlay with col replaced by values
+        """
+        overlay = self.copy()
+        overlay[col] = values
+        return overlay
+
+    def to_dataframe(self, keep=None):
+        """
+        Produce a dataframe with the base and the replaced columns
+        :param keep: Boolean array with the rows to keep (None to keep all)
+        :return: Dataframe
+        """
+        if keep is None:
+            dfFinal = self.base.copy(deep=True)
+        else:
+            # take returns a new dataframe that pandas does not flag as a slice of base
+            dfFinal = self.base.take(np.flatnonzero(keep))
+        for col, values in self.replaced.items():
+            if keep is not None:
+                values = values[keep]
+            dfFinal[col] = values
+        return dfFinal
@@ -0,0 +1,207 @@
+##########################################
+# PARALLEL SEARCH WITH A PROCESS POOL    #
+##########################################
+
+"""
+- Random search: the candidates are independent, so they are evaluated in batches in a process pool.
+- Backtracking: the top-level branches (no technique, or one technique on one column) are explored in parallel.
+The workers share the best utility found so far to prune the branches that can not improve it,
+and the budget of iterations is split between the branches.
+The model, the base plan and its evaluator are placed in __shared__ before the pool is created and the
+workers are forked, so the base arrays are inherited by the workers instead of being pickled for each task.
+Each task draws from its own stream spawned from the seed of the model, so a task always draws the same
+techniques and noise, whatever the worker that runs it.
+The workers inherit the deadline of the search and stop at it; only the main process calls on_progress,
+with the iterations reported by the finished tasks.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+
+from utils.search.overlay import ColumnOverlay
+from utils.search.plan import TransformationPlan
+
+__shared__ = {}
+
+
+def fork_context():
+    """
+    :return: the fork multiprocessing context, or None when the platform can not fork
+    """
+    try:
+        return multiprocessing.get_context("fork")
+    except ValueError:
+        return None
+
+
+def __plan_result__(best_plan, best_utility):
+    """
+    Picklable result of a worker: only the steps, the replaced columns and the kept rows
+    """
+    columns = {col: values.values for col, values in best_plan.frame.replaced.items()}
+    return best_utility, best_plan.steps, columns, best_plan.keep
+
+
+def __rebuild_plan__(base, result):
+    best_utility, steps, columns, keep = result
+    columns = {col: pd.Series(values, index=base.index, name=col) for col, values in columns.items()}
+    return TransformationPlan(base, steps, ColumnOverlay(base, columns), keep), best_utility
+
+
+def __random_batch__(seed, n_candidates):
+    """
+    Evaluate n_candidates random candidates in a worker
+    :param seed: SeedSequence of the stream of the task
+    :return: (iterations, result of the best candidate or None if no candidate improves the initial best utility)
+    """
+    model = __shared__["model"]
+    k, l, t = __shared__["klt"]
+    plan = __shared__["plan"]
+    evaluator = __shared__["evaluator"]
+    perturbation = __shared__["perturbation"]
+    stop_event = __shared__["stop_event"]
+    best_plan = __shared__["best_plan"]
+    best_utility = __shared__["best_utility"]
+    model.set_seed(seed)
+    iterations = 0
+    for i in range(n_candidates):
+        if stop_event.is_set() or model.__out_of_time__():
+            break
+        best_plan, best_utility = model.__achieve_klt_random__(k, l, t, plan, evaluator, perturbation,
+                                                               best_utility, best_plan)
+        iterations += 1
+        if best_utility >= model.stop_utility:
+            stop_event.set()
+            break
+    if best_plan is __shared__["best_plan"]:
+        return iterations, None
+    return iterations, __plan_result__(best_plan, best_utility)
+
+
+def __backtracking_branch__(seed, branch, budget):
+    """
+    Explore one top-level branch of the backtracking in a worker
+    :param seed: SeedSequence of the stream of the task
+    :param branch: None for the branch without technique, or (column position, technique, params, perturbation)
+    :param budget: iterations of the branch (None for no limit)
+    :return: (iterations, result of the best plan or None if the branch does not improve the initial best utility)
+    """
+    model = __shared__["model"]
+    k, l, t = __shared__["klt"]
+    plan = __shared__["plan"]
+    evaluator = __shared__["evaluator"]
+    perturbation = __shared__["perturbation"]
+    best_plan = __shared__["best_plan"]
+    best_utility = __shared__["best_utility"]
+    model.set_seed(seed)
+    model.iter = 0
+    model.MAX_ITERS = budget
+    model.bound = __shared__["bound"]
+    model.on_progress = None
+    if branch is None:
+        best_plan, best_utility = model.__achieve_klt_backtracking__(1, k, l, t, plan, evaluator, perturbation,
+                                                                     best_utility, best_plan)
+    else:
+        i, technique, params, cost = branch
+        if 1.0 / (perturbation + cost) <= model.__bound__(best_utility) or model.__out_of_time__():
+            return 0, None
+        try:
+            newPlan, newEvaluator, kept = model.__apply_technique__(plan, evaluator, model.list_cols[i], technique,
+                                                                    params)
+        except:
+            return 0, None
+        utility = (float(kept) / len(plan.base)) / (perturbation + cost)
+        if utility > best_utility:
+            best_plan = newPlan.filtered(newEvaluator.keep_mask())
+            best_utility = utility
+            model.__share_bound__(utility)
+        best_plan, best_utility = model.__achieve_klt_backtracking__(1, k, l, t, newPlan, newEvaluator,
+                                                                     perturbation + cost, best_utility, best_plan)
+    if best_plan is __shared__["best_plan"]:
+        return model.iter, None
+    return model.iter, __plan_result__(best_plan, best_utility)
+
+
+def __run_tasks__(model, k, l, t, plan, evaluator, perturbation, best_utility, best_plan, workers, worker,
+                  tasks):
+    """
+    Run the tasks in a forked process pool and keep the best plan returned by the workers
+    :param worker: function run by the workers, returning (iterations, result or None)
+    :param tasks: list of tuples with the arguments of each task
+    :return: (best_plan, best_utility)
+    """
+    context = fork_context()
+    __shared__.update({
+        "model": model,
+        "klt": (k, l, t),
+        "plan": plan,
+        "evaluator": evaluator,
+        "perturbation": perturbation,
+        "stop_event": context.Event(),
+        "bound": context.Value("d", best_utility),
+        "best_plan": best_plan,
+        "best_utility": best_utility
+    })
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            pending = set(executor.submit(worker, *task) for task in tasks)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    iterations, result = future.result()
+                    model.iter += iterations
+                    if result is not None and result[0] > best_utility:
+                        best_plan, best_utility = __rebuild_plan__(plan.base, result)
+                    model.__progress__(best_utility)
+                if best_utility >= model.stop_utility:
+                    # Stop early: the running tasks see the event, the pending ones are cancelled
+                    __shared__["stop_event"].set()
+                    for future in pending:
+                        future.cancel()
+                    break
+    finally:
+        __shared__.clear()
+    return best_plan, best_utility
+
+
+def achieve_klt_random_parallel(model, k, l, t, plan, evaluator, perturbation, best_utility, best_plan, MAX_ITERS,
+                                workers, batch_size=None):
+    """
+    Random search of model.achieve_klt_random with the candidates evaluated in a process pool
+    :param workers: number of processes
+    :param batch_size: candidates evaluated by each task
+    :return: (best_plan, best_utility)
+    """
+    if batch_size is None:
+        batch_size = max(1, MAX_ITERS // (workers * 4))
+    n_batches = (MAX_ITERS + batch_size - 1) // batch_size
+    seeds = model.spawn_seeds(n_batches)
+    tasks = [(seeds[i], min(batch_size, MAX_ITERS - i * batch_size)) for i in range(n_batches)]
+    return __run_tasks__(model, k, l, t, plan, evaluator, perturbation, best_utility, best_plan, workers,
+                         __random_batch__, tasks)
+
+
+def achieve_klt_backtracking_parallel(model, k, l, t, plan, evaluator, perturbation, best_utility, best_plan,
+                                      MAX_ITERS, workers):
+    """
+    Backtracking of model.achieve_klt_backtracking with the top-level branches explored in a process pool.
+    The branch without technique is explored once: the serial search repeats it for every column.
+    :param MAX_ITERS: budget of iterations split between the branches (None for no limit)
+    :param workers: number of processes
+    :return: (best_plan, best_utility)
+    """
+    branches = [None]
+    for i, col in enumerate(model.list_cols):
+        for n in range(6):
+            for technique, params, cost in model.__techniques__(plan, col, n, [0.1, 0.25, 0.4]):
+                branches.append((i, technique, params, cost))
+    seeds = model.spawn_seeds(len(branches))
+    tasks = []
+    for i, branch in enumerate(branches):
+        budget = None
+        if MAX_ITERS is not None:
+            budget = MAX_ITERS // len(branches) + (1 if i < MAX_ITERS % len(branches) else 0)
+        tasks.append((seeds[i], branch, budget))
+    return __run_tasks__(model, k, l, t, plan, evaluator, perturbation, best_utility, best_plan, workers,
+                         __backtracking_branch__, tasks)
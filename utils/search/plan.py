@@ -0,0 +1,120 @@
+##########################################
+# LAZY TRANSFORMATION PLANS              #
+##########################################
+
+"""
+A transformation plan is an ordered list of (column, technique, params) applied to a base dataframe.
+The plan keeps a ColumnOverlay with the columns it has replaced, every other column is shared with the base
+dataframe, so the search can score thousands of plans without copying the dataframe.
+A full dataframe is only produced for the winning plan with materialize().
+"""
+import pandas as pd
+
+from utils.search.overlay import ColumnOverlay
+from utils.search.cache import DETERMINISTIC_TECHNIQUES, column_fingerprint, derived_fingerprint
+from utils.techniques.generalization import generalization_categorical_semantic, generalization_mask, \
+    generalization_numerical_interval, generalization_suppression, generalization_hierarchy
+from utils.techniques.perturbation import perturbation_noise_addition, perturbation_permutation, \
+    perturbation_micro_aggregation, perturbation_laplace, perturbation_gaussian
+
+TECHNIQUES = {
+    "generalization_categorical_semantic": generalization_categorical_semantic,
+    "generalization_numerical_interval": generalization_numerical_interval,
+    "generalization_mask": generalization_mask,
+    "generalization_hierarchy": generalization_hierarchy,
+    "generalization_suppression": generalization_suppression,
+    "perturbation_permutation": perturbation_permutation,
+    "perturbation_noise_addition": perturbation_noise_addition,
+    "perturbation_micro_aggregation": perturbation_micro_aggregation,
+    "perturbation_laplace": perturbation_laplace,
+    "perturbation_gaussian": perturbation_gaussian,
+}
+
+
+def apply_technique(values, technique, params, **kwargs):
+    """
+    Apply a technique to a single column
+    :param values: Series with the column
+    :param technique: name of the technique in TECHNIQUES
+    :param params: tuple with the params of the technique after the column index
+    :param kwargs: arguments of the technique that are not part of the plan, such as the random generator
+    :return: Series with the new values, in the same order and with the same index as values
+    """
+    col = values.name
+    frame = values.reset_index(drop=True).to_frame()
+    result = TECHNIQUES[technique](frame, col, *params, **kwargs)[col]
+    # Some techniques sort the rows, restore the original order
+    if not result.index.is_monotonic_increasing:
+        result = result.sort_index()
+    return pd.Series(result.values, index=values.index, name=col)
+
+
+class TransformationPlan:
+    def __init__(self, base, steps=(), frame=None, keep=None, fingerprints=None, base_fingerprints=None):
+        """
+        :param base: base dataframe or ColumnOverlay, never modified
+        :param steps: tuple of (column, technique, params)
+        :param frame: ColumnOverlay of base with the columns replaced by the steps
+        :param keep: Boolean array with the rows kept in the final dataframe (None to keep all)
+        :param fingerprints: dict {column: fingerprint} of the columns replaced by the steps
+        :param base_fingerprints: dict {column: fingerprint} of the base columns, shared by all the plans of a base
+        """
+        self.base = base
+        self.steps = tuple(steps)
+        self.frame = frame if frame is not None else ColumnOverlay(base)
+        self.keep = keep
+        self.fingerprints = fingerprints if fingerprints is not None else {}
+        self.base_fingerprints = base_fingerprints if base_fingerprints is not None else {}
+
+    def column(self, col):
+        """
+        :return: actual values of col after applying the plan
+        """
+        return self.frame[col]
+
+    def fingerprint(self, col):
+        """
+        :return: fingerprint of the actual values of col
+        """
+        if col in self.fingerprints:
+            return self.fingerprints[col]
+        return self.base_fingerprint(col)
+
+    def base_fingerprint(self, col):
+        """
+        :return: fingerprint of the values of col in the base dataframe
+        """
+        if col not in self.base_fingerprints:
+            self.base_fingerprints[col] = column_fingerprint(self.base[col])
+        return self.base_fingerprints[col]
+
+    def extend(self, col, technique, params, values=None):
+        """
+        New plan with one more step. Only the column of the step is computed.
+        :param values: result of the step if it is already known (for example from a cache)
+        :return: TransformationPlan
+        """
+        if values is None:
+            values = apply_technique(self.column(col), technique, params)
+        else:
+            values = pd.Series(values.values, index=self.frame.index, name=col)
+        parent = self.fingerprint(col) if technique in DETERMINISTIC_TECHNIQUES else ""
+        fingerprints = dict(self.fingerprints)
+        fingerprints[col] = derived_fingerprint(parent, technique, params)
+        return TransformationPlan(self.base, self.steps + ((col, technique, params),),
+                                  self.frame.with_column(col, values), None, fingerprints, self.base_fingerprints)
+
+    def filtered(self, keep):
+        """
+        Same plan keeping only some rows in the final dataframe
+        :param keep: Boolean array
+        :return: TransformationPlan
+        """
+        return TransformationPlan(self.base, self.steps, self.frame, keep, self.fingerprints, self.base_fingerprints)
+
+    def materialize(self):
+        """
+        Produce the dataframe of the plan
+        :return: Dataframe
+        """
+        return self.frame.to_dataframe(self.keep)
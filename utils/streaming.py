@@ -0,0 +1,366 @@
+##########################################
+# STREAMING ANONYMIZATION OF LARGE CSV   #
+##########################################
+
+"""
+Anonymize a CSV file larger than the memory, reading it in chunks:
+- Pass 1: the chunks are read once to keep a uniform sample of the rows and a sketch of each column (type,
+  number of rows, missing values, minimum and maximum). The search runs on the sample and its plan is frozen:
+  every step becomes a function of a single chunk, and the parameters that depend on the whole column (bins of
+  the numerical intervals, blocks of the micro-aggregation, sensitivity of the noise) are taken from the sample
+  and the sketches.
+- Pass 2: the chunks are streamed again, first only the quasi-identifiers and the sensitive columns to count the
+  rows of each group of the plan, then every column to apply the plan, suppress the groups that do not achieve
+  k and distinct l, pseudonymize the identifiers and append the chunk to the output file.
+Only the sample, one chunk and the counts of the groups are in memory at any time.
+The random techniques draw from one stream per chunk, so both reads of a chunk produce the same values.
+The permutation shuffles the rows of each chunk, and the noise addition uses the deviation of each chunk.
+t-closeness and the entropy and recursive l-diversity are only checked on the sample, by the search.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.Anonymization import Anonymization
+from utils.search.cache import DETERMINISTIC_TECHNIQUES
+from utils.search.plan import TECHNIQUES, apply_technique
+from utils.techniques.binning import BinningIndex
+from utils.techniques.perturbation import micro_aggregation_bins
+
+# Position of the sensitivity in the params of the differential privacy mechanisms
+SENSITIVITY_PARAMS = {"perturbation_laplace": 1, "perturbation_gaussian": 2}
+
+
+def __merge_counts__(keys, counts):
+    """
+    Add up the counts of equal keys
+    :return: (sorted distinct keys, count of each one)
+    """
+    keys, counts = np.concatenate(keys), np.concatenate(counts)
+    order = np.argsort(keys, kind="stable")
+    keys, counts = keys[order], counts[order]
+    starts = np.flatnonzero(np.append(True, keys[1:] != keys[:-1])[:len(keys)])
+    return keys[starts], np.add.reduceat(counts, starts) if len(keys) else counts
+
+
+def __merge_pairs__(groups, values, l):
+    """
+    Distinct (group, value) pairs, keeping the l lowest values of each group
+    :return: (groups, values) sorted by group and value
+    """
+    groups, values = np.concatenate(groups), np.concatenate(values)
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    distinct = np.append(True, (groups[1:] != groups[:-1]) | (values[1:] != values[:-1]))[:len(groups)]
+    groups, values = groups[distinct], values[distinct]
+    first = np.append(True, groups[1:] != groups[:-1])[:len(groups)]
+    starts = np.flatnonzero(first)
+    position = np.arange(len(groups)) - starts[np.cumsum(first) - 1]
+    return groups[position < l], values[position < l]
+
+
+class GroupCounts:
+    def __init__(self, sensible_index, l=None):
+        """
+        Rows and distinct sensitive values (up to l) of each group, added chunk by chunk.
+        Each chunk is reduced to its partial counts, and the partial counts are merged in bulk with the merged
+        counts once they are as large as them, so every count is merged O(log(chunks)) times.
+        :param sensible_index: sensitive columns whose distinct values are counted
+        """
+        self.l = l
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.pairs = {col: (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64)) for col in sensible_index}
+        self.pending = ([], [], {col: ([], []) for col in sensible_index})
+        self.pending_size = 0
+
+    def add(self, groups, values):
+        """
+        :param groups: group key of each row of a chunk
+        :param values: {sensitive column: hash of the value of each row of the chunk}
+        """
+        keys, counts = np.unique(groups, return_counts=True)
+        self.pending[0].append(keys)
+        self.pending[1].append(counts.astype(np.int64))
+        self.pending_size += len(keys)
+        for col, (pending_groups, pending_values) in self.pending[2].items():
+            pair_groups, pair_values = __merge_pairs__([groups], [values[col]], self.l)
+            pending_groups.append(pair_groups)
+            pending_values.append(pair_values)
+            self.pending_size += len(pair_groups)
+        if self.pending_size >= len(self.keys) + sum(len(pair[0]) for pair in self.pairs.values()):
+            self.merge()
+
+    def merge(self):
+        """
+        Merge the partial counts of the chunks with the merged counts
+        """
+        self.keys, self.counts = __merge_counts__([self.keys] + self.pending[0], [self.counts] + self.pending[1])
+        for col, (pending_groups, pending_values) in self.pending[2].items():
+            self.pairs[col] = __merge_pairs__([self.pairs[col][0]] + pending_groups,
+                                              [self.pairs[col][1]] + pending_values, self.l)
+        self.pending = ([], [], {col: ([], []) for col in self.pairs})
+        self.pending_size = 0
+
+    def passing(self, k=None):
+        """
+        :return: array with the keys of the groups that achieve k and distinct l
+        """
+        self.merge()
+        passing = np.ones(len(self.keys), dtype=bool)
+        if k is not None:
+            passing &= self.counts >= k
+        for pair_groups, _ in self.pairs.values():
+            pair_keys, distinct = np.unique(pair_groups, return_counts=True)
+            achieved = np.zeros(len(self.keys), dtype=bool)
+            achieved[np.searchsorted(self.keys, pair_keys[distinct >= self.l])] = True
+            passing &= achieved
+        return self.keys[passing]
+
+
+class StreamingAnonymization:
+    def __init__(self, path, identifiers_index, quasi_identifiers_index, sensible_index, categories_hierarchy,
+                 l_diversity="distinct", c=None, t_distance="ks", chunksize=100000, sample_size=100000, seed=None,
+                 read_options=None):
+        """
+        :param path: path of the CSV file
+        :param chunksize: rows of each chunk
+        :param sample_size: rows of the sample used to choose the plan
+        :param seed: seed of the sample, the search and the random techniques (None for a random seed)
+        :param read_options: dict with other arguments of pd.read_csv (sep, encoding...)
+        The other params are the params of Anonymization.
+        """
+        self.path = path
+        self.identifiers_index = identifiers_index
+        self.quasi_identifiers_index = quasi_identifiers_index
+        self.sensible_index = sensible_index
+        self.categories_hierarchy = categories_hierarchy
+        self.l_diversity = l_diversity
+        self.c = c
+        self.t_distance = t_distance
+        self.chunksize = chunksize
+        self.sample_size = sample_size
+        self.read_options = read_options or {}
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.model_seed, self.sample_seed, self.chunk_seed = self.seed_sequence.spawn(3)
+        self.sketches = {}
+        self.dtypes = None
+        self.model = None
+        self.steps = ()
+        self.frozen_steps = []
+        self.rows_read = 0
+        self.rows_written = 0
+
+    def __chunks__(self, usecols=None):
+        """
+        :param usecols: columns to read (None for all)
+        :return: generator of Dataframes
+        """
+        options = dict(self.read_options)
+        if self.dtypes is not None:
+            options["dtype"] = {col: dtype for col, dtype in self.dtypes.items() if usecols is None or col in usecols}
+        return pd.read_csv(self.path, chunksize=self.chunksize, usecols=usecols, **options)
+
+    def __chunk_rng__(self, i):
+        """
+        Random generator of the chunk i, the same in every pass
+        """
+        return np.random.default_rng(np.random.SeedSequence(self.chunk_seed.entropy,
+                                                            spawn_key=self.chunk_seed.spawn_key + (i,)))
+
+    def __sketch__(self, chunk):
+        """
+        Update the sketch of each column with a chunk
+        """
+        for col in chunk.columns:
+            values = chunk[col]
+            sketch = self.sketches.setdefault(col, {"dtype": values.dtype, "rows": 0, "missing": 0,
+                                                    "min": None, "max": None})
+            sketch["rows"] += len(values)
+            sketch["missing"] += int(values.isna().sum())
+            numeric = pd.api.types.is_numeric_dtype(values) and pd.api.types.is_numeric_dtype(sketch["dtype"])
+            sketch["dtype"] = np.result_type(sketch["dtype"], values.dtype) if numeric else np.dtype(object)
+            if numeric and values.notna().any():
+                low, high = float(values.min()), float(values.max())
+                sketch["min"] = low if sketch["min"] is None else min(sketch["min"], low)
+                sketch["max"] = high if sketch["max"] is None else max(sketch["max"], high)
+
+    def scan(self):
+        """
+        Pass 1: read the chunks once to sketch the columns and keep a uniform sample of sample_size rows.
+        Every row gets a random key and the rows with the lowest keys are the sample.
+        :return: Dataframe with the sample, in the order of the file
+        """
+        rng = np.random.default_rng(self.sample_seed)
+        self.sketches = {}
+        self.dtypes = None
+        sample = None
+        keys = np.empty(0)
+        for chunk in self.__chunks__():
+            self.__sketch__(chunk)
+            chunk_keys = rng.random(len(chunk))
+            if len(keys) >= self.sample_size:
+                selected = chunk_keys < keys.max()
+                chunk, chunk_keys = chunk[selected], chunk_keys[selected]
+            sample = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+            keys = np.concatenate([keys, chunk_keys])
+            if len(keys) > self.sample_size:
+                kept = np.sort(np.argpartition(keys, self.sample_size - 1)[:self.sample_size])
+                sample, keys = sample.iloc[kept].reset_index(drop=True), keys[kept]
+        # The next passes read every chunk with the types of the whole column
+        self.dtypes = {col: sketch["dtype"] for col, sketch in self.sketches.items()
+                       if sketch["dtype"] != np.dtype(object)}
+        return sample.astype(self.dtypes)
+
+    def fit(self, k, l, t, strategy="achieve_klt_lattice", **search_options):
+        """
+        Pass 1: choose the plan on the sample with a search of Anonymization and freeze it
+        :param strategy: name of the search method of Anonymization. Its plan has to be made of techniques of
+        TECHNIQUES: Mondrian and MDAV depend on the whole table and can not be streamed.
+        :param search_options: other arguments of the search
+        :return: (sample_df, sample_utility) anonymized sample and its utility
+        """
+        sample = self.scan()
+        self.model = Anonymization(sample, self.identifiers_index, self.quasi_identifiers_index, self.sensible_index,
+                                   self.categories_hierarchy, self.l_diversity, self.c, self.t_distance,
+                                   seed=self.model_seed, copy=False)
+        sample_df, sample_utility = getattr(self.model, strategy)(k, l, t, **search_options)
+        self.steps = self.model.steps
+        self.frozen_steps = self.__freeze__(self.steps, sample)
+        return sample_df, sample_utility
+
+    def __freeze__(self, steps, sample):
+        """
+        Turn each step of the plan into a function of one chunk, function(raw column, actual column, rng)
+        :return: list of (column, function)
+        """
+        frozen = []
+        columns = {}
+        for position, (col, technique, params) in enumerate(steps):
+            if technique not in TECHNIQUES:
+                raise ValueError("The technique %s depends on the whole table and can not be streamed" % technique)
+            raw = all(step[0] != col for step in steps[:position])
+            sketch = self.sketches.get(col, {})
+            if technique == "generalization_numerical_interval":
+                edges = BinningIndex(columns.get(col, sample[col])).edges(params[0])
+                if raw and sketch.get("min") is not None:
+                    # The bins of the sample are widened to the whole column
+                    edges[0], edges[-1] = min(edges[0], sketch["min"]), max(edges[-1], sketch["max"])
+                function = self.__interval__(edges)
+            elif technique == "perturbation_micro_aggregation":
+                function = self.__micro_aggregation__(*micro_aggregation_bins(columns.get(col, sample[col]),
+                                                                              params[0]))
+            elif technique in SENSITIVITY_PARAMS:
+                # Without a sensitivity the mechanisms use the range of the column, not the range of the chunk
+                options = {}
+                position = SENSITIVITY_PARAMS[technique]
+                if len(params) <= position or params[position] is None:
+                    values = columns.get(col, sample[col])
+                    low, high = (sketch.get("min"), sketch.get("max")) if raw else (values.min(), values.max())
+                    sensitivity = float(high - low) if low is not None and pd.notna(low) else 0.0
+                    if len(params) <= position:
+                        options["sensitivity"] = sensitivity
+                    else:
+                        params = params[:position] + (sensitivity,) + params[position + 1:]
+                function = self.__technique__(technique, params, options)
+            elif technique == "generalization_hierarchy" and \
+                    all(step[1] == technique for step in steps[:position] if step[0] == col):
+                # As in the search, the levels are computed from the original values
+                function = self.__technique__(technique, params, {}, source_raw=True)
+            else:
+                function = self.__technique__(technique, params, {})
+            columns[col] = function(sample[col], columns.get(col, sample[col]), np.random.default_rng(0))
+            frozen.append((col, function))
+        return frozen
+
+    @staticmethod
+    def __interval__(edges):
+        def function(raw, values, rng):
+            bins = edges if len(edges) > 1 else 1
+            return pd.Series(pd.cut(values.astype(np.float64), bins=bins, include_lowest=True), index=values.index,
+                             name=values.name)
+        return function
+
+    @staticmethod
+    def __micro_aggregation__(upper, means):
+        def function(raw, values, rng):
+            numbers = values.to_numpy(dtype=np.float64)
+            if len(means) == 0:
+                return values
+            aggregated = means[np.searchsorted(upper, numbers, side="left")]
+            aggregated[np.isnan(numbers)] = np.nan
+            return pd.Series(aggregated, index=values.index, name=values.name)
+        return function
+
+    @staticmethod
+    def __technique__(technique, params, options, source_raw=False):
+        def function(raw, values, rng):
+            arguments = dict(options)
+            if technique not in DETERMINISTIC_TECHNIQUES:
+                arguments["rng"] = rng
+            return apply_technique(raw if source_raw else values, technique, params, **arguments)
+        return function
+
+    def __apply__(self, i, chunk):
+        """
+        Apply the frozen plan to the chunk i
+        :return: Dataframe
+        """
+        rng = self.__chunk_rng__(i)
+        raw = {}
+        for col, function in self.frozen_steps:
+            if col in chunk:
+                raw.setdefault(col, chunk[col])
+                chunk[col] = function(raw[col], chunk[col], rng)
+        return chunk
+
+    def __group_keys__(self, chunk, columns):
+        """
+        64-bit hash of the values of the columns of each row, the same for equal rows of different chunks
+        """
+        return pd.util.hash_pandas_object(chunk[columns], index=False).to_numpy()
+
+    def count_groups(self, k=None, l=None):
+        """
+        Pass 2, first read: count the rows and the distinct sensitive values (up to l) of each group of the plan.
+        Only the quasi-identifiers and the sensitive columns are read.
+        :return: array with the keys of the groups that achieve k and distinct l
+        """
+        counts = GroupCounts(self.sensible_index if l is not None else [], l)
+        columns = self.quasi_identifiers_index + [col for col in self.sensible_index
+                                                  if col not in self.quasi_identifiers_index]
+        for i, chunk in enumerate(self.__chunks__(usecols=columns)):
+            chunk = self.__apply__(i, chunk[columns])
+            counts.add(self.__group_keys__(chunk, self.quasi_identifiers_index),
+                       {col: self.__group_keys__(chunk, [col]) for col in counts.pairs})
+        return counts.passing(k)
+
+    def transform(self, output_path, k=None, l=None, pseudonymization=None):
+        """
+        Pass 2: stream the chunks, apply the frozen plan, suppress the groups that do not achieve k and distinct l,
+        pseudonymize the identifiers and write the anonymized chunks to output_path
+        :param pseudonymization: dict {identifier: function(dataframe, identifier)} with a pseudonymization technique
+        that handles each value on its own, such as pseudonymization_hmac or pseudonymization_encryption
+        :return: number of rows written
+        """
+        passing = self.count_groups(k, l) if k is not None or l is not None else None
+        self.rows_read = 0
+        self.rows_written = 0
+        with open(output_path, "w", newline="") as output:
+            for i, chunk in enumerate(self.__chunks__()):
+                self.rows_read += len(chunk)
+                chunk = self.__apply__(i, chunk)
+                if passing is not None:
+                    chunk = chunk[np.isin(self.__group_keys__(chunk, self.quasi_identifiers_index), passing)]
+                for identifier, function in (pseudonymization or {}).items():
+                    chunk = function(chunk, identifier)
+                chunk.to_csv(output, header=i == 0, index=False)
+                self.rows_written += len(chunk)
+        return self.rows_written
+
+    def run(self, output_path, k, l, t, strategy="achieve_klt_lattice", pseudonymization=None, **search_options):
+        """
+        Both passes: choose the plan on a sample and write the anonymized file
+        :return: (rows written, utility of the plan on the sample)
+        """
+        _, sample_utility = self.fit(k, l, t, strategy, **search_options)
+        return self.transform(output_path, k, l, pseudonymization), sample_utility
@@ -0,0 +1,81 @@
+#############################################
+# BINNING INDEX OF A NUMERICAL COLUMN       #
+#############################################
+
+"""
+The numerical generalization bins a column by its quantiles np.arange(0, 1, step).
+The index sorts the column only once: the quantiles of every step are interpolated from the sorted values,
+the bucket of each row is found by binary search in the edges, and the codes of each step are cached.
+The edges of a step are its quantiles plus the maximum of the column (the closing edge), and the lowest
+edge is included, so no value of the column falls out of the bins.
+The intervals are the same as pd.cut(values, bins=edges, include_lowest=True).
+"""
+import numpy as np
+import pandas as pd
+
+
+class BinningIndex:
+    def __init__(self, values):
+        """
+        :param values: Series or array with the numerical values of the column
+        """
+        self.values = np.asarray(values, dtype=np.float64)
+        self.missing = np.isnan(self.values)
+        self.sorted_values = np.sort(self.values[~self.missing])
+        self.levels = {}
+
+    def quantiles(self, step):
+        """
+        Quantiles np.arange(0, 1, step) with linear interpolation, as Series.quantile
+        """
+        # Same arithmetic as np.percentile, used by Series.quantile, so the edges are exactly the same
+        positions = (np.arange(0, 1, step) * 100) / 100 * (len(self.sorted_values) - 1)
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.minimum(lower + 1, len(self.sorted_values) - 1)
+        fraction = positions - lower
+        below = self.sorted_values[lower]
+        above = self.sorted_values[upper]
+        difference = above - below
+        return np.where(fraction >= 0.5, above - difference * (1 - fraction), below + difference * fraction)
+
+    def edges(self, step):
+        """
+        :return: sorted distinct edges of the bins of a step, with the closing edge
+        """
+        return np.unique(np.append(self.quantiles(step), self.sorted_values[-1]))
+
+    def level(self, step):
+        """
+        :return: (IntervalIndex with the bins, code of the bin of each row, -1 for missing values)
+        """
+        if step not in self.levels:
+            if len(self.sorted_values) == 0:
+                intervals = pd.IntervalIndex.from_breaks([], closed="right")
+                codes = np.full(len(self.values), -1)
+            else:
+                edges = self.edges(step)
+                if len(edges) == 1:
+                    # Constant column: a single bin around the value, as pd.cut does with bins=1
+                    intervals = pd.cut(edges, bins=1).categories
+                    codes = np.zeros(len(self.values), dtype=np.int64)
+                else:
+                    intervals = pd.cut(edges, bins=edges, include_lowest=True).categories
+                    codes = np.maximum(np.searchsorted(edges, self.values, side="left") - 1, 0)
+                codes[self.missing] = -1
+            dtype = np.int8 if len(intervals) < np.iinfo(np.int8).max else np.int32
+            self.levels[step] = (intervals, codes.astype(dtype))
+        return self.levels[step]
+
+    def generalize(self, step):
+        """
+        :return: Categorical with the bin of each row
+        """
+        intervals, codes = self.level(step)
+        return pd.Categorical.from_codes(codes, intervals, ordered=True)
+
+    def memory_usage(self):
+        """
+        Bytes used by the sorted values and the cached codes
+        """
+        return int(self.values.nbytes + self.sorted_values.nbytes +
+                   sum(codes.nbytes for _, codes in self.levels.values()))
@@ -8,36 +8,81 @@ input col: column index from dataframe to generalize
 objective: apply a generalization technique to the specified columns
 :return: Dataframe
 """
-import numpy as np
 import pandas as pd
 from scipy import stats
+from utils.techniques.binning import BinningIndex
 
-def generalization_numerical_interval(dataframe, col, step):
-    quantiles = np.arange(0, 1, step)
-    intervals = dataframe[col].quantile(quantiles)
-    intervals = intervals.drop_duplicates()
-    intervals = intervals.tolist()
+def generalization_numerical_interval(dataframe, col, step, index=None):
+    # index: BinningIndex of the column, to reuse its sorted values and bins between calls
+    if index is None:
+        index = BinningIndex(dataframe[col])
     dfFinal = dataframe.copy(deep=True)
-    dfFinal[col] = pd.cut(dfFinal[col], bins=intervals)
+    dfFinal[col] = index.generalize(step)
+    return dfFinal
+
+def __row_values__(dataframe, col):
+    """
+    Values of col as the rows of iterrows return them: upcast to the common dtype of all the columns
+    """
+    values = dataframe[col]
+    dtype = dataframe.iloc[:0].values.dtype
+    if values.dtype != dtype:
+        values = values.astype(dtype)
+    return values
+
+def __set_strings__(dfFinal, col, strings):
+    """
+    Write a column of strings like writing them row by row: the column becomes object,
+    a string column keeps its dtype and a categorical column only accepts its categories
+    """
+    values = dfFinal[col]
+    if len(values) == 0:
+        return dfFinal
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        new_categories = ~strings.isin(values.cat.categories)
+        if new_categories.any():
+            raise TypeError("Cannot setitem on a Categorical with a new category (%s), set the categories first"
+                            % strings[new_categories].iloc[0])
+        dfFinal[col] = pd.Categorical(strings, categories=values.cat.categories, ordered=values.cat.ordered)
+    elif isinstance(values.dtype, pd.StringDtype):
+        dfFinal[col] = strings.astype(values.dtype)
+    else:
+        dfFinal[col] = strings.astype(object)
     return dfFinal
 
 def generalization_mask(dataframe, col, num_mask):
     dfFinal = dataframe.copy(deep=True)
     mask = "*" * num_mask
-    for index, row in dfFinal.iterrows():
-        number = str(row[col])
-        masked = number[:-num_mask] + mask
-        dfFinal.at[index, col] = masked
-    return dfFinal
+    numbers = __row_values__(dataframe, col).astype(str)
+    masked = numbers.str[:-num_mask] + mask
+    return __set_strings__(dfFinal, col, masked)
 
 def generalization_categorical_semantic(dataframe, col, hierarchy):
     dfFinal = dataframe.copy(deep=True)
-    for index, row in dfFinal.iterrows():
-        value = str(row[col])
-        res = "Other"
-        for key, values in hierarchy.items():
-            if value in values:
-                res = key
-                break
-        dfFinal.at[index, col] = res
+    values = __row_values__(dataframe, col).astype(str)
+    if any(isinstance(category_values, str) for category_values in hierarchy.values()):
+        # "value in category_values" is a substring test, so each distinct value is looked up
+        def category(value):
+            for key, category_values in hierarchy.items():
+                if value in category_values:
+                    return key
+            return "Other"
+        inverted = {value: category(value) for value in values.unique()}
+    else:
+        # Inverted hierarchy: the first category containing a value wins
+        inverted = {}
+        for key, category_values in hierarchy.items():
+            for value in category_values:
+                inverted.setdefault(value, key)
+    res = values.map(inverted).fillna("Other")
+    return __set_strings__(dfFinal, col, res)
+
+def generalization_hierarchy(dataframe, col, hierarchy, level):
+    dfFinal = dataframe.copy(deep=True)
+    dfFinal[col] = hierarchy.generalize(dfFinal[col], level)
+    return dfFinal
+
+def generalization_suppression(dataframe, col):
+    dfFinal = dataframe.copy(deep=True)
+    dfFinal[col] = "*"
     return dfFinal
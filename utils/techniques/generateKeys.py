@@ -1,31 +1,118 @@
 import secrets
 from cryptography.fernet import Fernet
 import os
+import re
+
+# Kinds of keys: name of their files and function that generates a new key
+KEY_KINDS = {
+    "secret": ("secret_key", lambda: secrets.token_bytes(32)),
+    "encryption": ("encription_key", Fernet.generate_key),
+}
+
+
+class KeyManager:
+    def __init__(self, directory=None):
+        """
+        Keys of the pseudonymization techniques, read once and cached in memory.
+        There are two kinds of keys: "secret" (HMAC) and "encryption" (Fernet and AES-SIV). Every key has an id:
+        the files secret_key.bin and encription_key.bin are the keys "0", and each rotation writes the file
+        <name>.<id>.bin with the next id. The key with the highest id is the current key, used to pseudonymize,
+        and the older keys are kept to revert the pseudonyms made with them.
+        :param directory: directory of the key files (None for the directory of this module)
+        """
+        self.directory = directory or os.path.dirname(os.path.abspath(__file__))
+        self.keys = {}  # {(kind, key id): key}
+        self.current = {}  # {kind: key id}
+
+    def __path__(self, kind, key_id):
+        name = KEY_KINDS[kind][0]
+        return os.path.join(self.directory, name + (".bin" if key_id == "0" else ".%s.bin" % key_id))
+
+    def key_ids(self, kind):
+        """
+        :return: ids of the keys of a kind in the directory, sorted
+        """
+        pattern = re.escape(KEY_KINDS[kind][0]) + r"(?:\.(\d+))?\.bin"
+        key_ids = []
+        for file_name in os.listdir(self.directory):
+            match = re.fullmatch(pattern, file_name)
+            if match:
+                key_ids.append(match.group(1) or "0")
+        return sorted(key_ids, key=int)
+
+    def current_id(self, kind):
+        """
+        Id of the current key of a kind. If there is no key yet (or the only key file is empty) a key is generated.
+        """
+        if kind not in self.current:
+            key_ids = [key_id for key_id in self.key_ids(kind) if os.path.getsize(self.__path__(kind, key_id)) > 0]
+            self.current[kind] = key_ids[-1] if key_ids else self.generate(kind, "0")
+        return self.current[kind]
+
+    def key(self, kind, key_id=None):
+        """
+        :param key_id: id of the key (None for the current key)
+        :return: bytes of the key, read from its file only the first time
+        """
+        key_id = self.current_id(kind) if key_id is None else str(key_id)
+        if (kind, key_id) not in self.keys:
+            with open(self.__path__(kind, key_id), "rb") as file:
+                key = file.read()
+            if not key:
+                raise ValueError("The %s key %s is empty" % (kind, key_id))
+            self.keys[(kind, key_id)] = key
+        return self.keys[(kind, key_id)]
+
+    def generate(self, kind, key_id):
+        """
+        Write a new key with key_id, replacing the key with the same id
+        :return: key_id
+        """
+        key = KEY_KINDS[kind][1]()
+        with open(self.__path__(kind, key_id), "wb") as binary_file:
+            binary_file.write(key)
+        self.keys[(kind, key_id)] = key
+        return key_id
+
+    def rotate(self, kind):
+        """
+        Generate a new key with the next id and make it the current key. The older keys are kept.
+        :return: id of the new key
+        """
+        key_ids = self.key_ids(kind)
+        key_id = self.generate(kind, str(int(key_ids[-1]) + 1 if key_ids else 0))
+        self.current[kind] = key_id
+        return key_id
+
+    def clear(self):
+        """
+        Forget the cached keys, they are read again from their files
+        """
+        self.keys = {}
+        self.current = {}
+
+
+# KeyManager of the process for the key files of this module
+__key_manager__ = KeyManager()
+
+
+def default_key_manager():
+    return __key_manager__
 
 
 def generate_encryption_key():
-    dir = os.path.dirname(os.path.abspath(__file__))
-    key = Fernet.generate_key()
-    with open(dir + "/encription_key.bin", "wb") as binary_file:
-        binary_file.write(key)
+    __key_manager__.generate("encryption", "0")
+    __key_manager__.current.pop("encryption", None)
 
 
 def load_encription_key():
-    dir = os.path.dirname(os.path.abspath(__file__))
-    file = open(dir + "/encription_key.bin", "rb")
-    key = file.read()
-    return key
+    return __key_manager__.key("encryption")
 
 
 def generate_secret_key():
-    dir = os.path.dirname(os.path.abspath(__file__))
-    key = secrets.token_bytes(32)
-    with open(dir + "/secret_key.bin", "wb") as binary_file:
-        binary_file.write(key)
+    __key_manager__.generate("secret", "0")
+    __key_manager__.current.pop("secret", None)
 
 
 def load_secret_key():
-    dir = os.path.dirname(os.path.abspath(__file__))
-    file = open(dir + "/secret_key.bin", "rb")
-    key = file.read()
-    return key
+    return __key_manager__.key("secret")
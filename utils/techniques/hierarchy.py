@@ -0,0 +1,163 @@
+#############################################
+# COMPILED GENERALIZATION HIERARCHIES       #
+#############################################
+
+"""
+A hierarchy is a tree of generalizations of the values of a column, for example city -> region -> country -> *.
+It is compiled once into integer arrays:
+- codes[h]: code of the label at level h of each value of the hierarchy (level 0 are the values themselves)
+- parents[h]: code of the label at level h + 1 of each label at level h
+so generalizing to any level is one lookup on the codes of the distinct values of the column.
+The rows of an ARX hierarchy file have the same layout: value;level 1;level 2;...;top level
+"""
+import csv
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+class Hierarchy:
+    def __init__(self, rows):
+        """
+        :param rows: one list per value with its generalization at each level, [value, level 1, ..., top level].
+        Rows shorter than the longest one repeat their first generalization.
+        """
+        rows = [[str(label) for label in row] for row in rows if len(row) > 0]
+        n_levels = max((len(row) for row in rows), default=1)
+        rows = [row[:1] + row[1:2] * (n_levels - len(row)) + row[1:] if len(row) > 1 else row * n_levels
+                for row in rows]
+        # The first row of a repeated value wins
+        unique_rows = {}
+        for row in rows:
+            unique_rows.setdefault(row[0], row)
+        rows = list(unique_rows.values())
+        self.rows = rows
+        self.n_levels = n_levels
+        self.labels = []
+        self.codes = []
+        for level in range(n_levels):
+            codes, labels = pd.factorize(np.array([row[level] for row in rows], dtype=object))
+            self.codes.append(codes.astype(np.int64))
+            self.labels.append(np.asarray(labels, dtype=object))
+        self.parents = []
+        for level in range(n_levels - 1):
+            parents = np.full(len(self.labels[level]), -1, dtype=np.int64)
+            parents[self.codes[level]] = self.codes[level + 1]
+            if (parents[self.codes[level]] != self.codes[level + 1]).any():
+                raise ValueError("The hierarchy is not a tree: a label of level %d has several parents" % level)
+            self.parents.append(parents)
+        # Values and labels of every level, the lowest level wins
+        self.lookup = {}
+        for level in range(n_levels):
+            for code, label in enumerate(self.labels[level]):
+                self.lookup.setdefault(label, (level, code))
+        self.digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()
+
+    def __repr__(self):
+        # Used in the keys of the technique cache, so it depends on the content
+        return "Hierarchy(levels=%d, values=%d, digest=%s)" % (self.n_levels, len(self.rows), self.digest)
+
+    @classmethod
+    def from_dict(cls, hierarchy):
+        """
+        :param hierarchy: {category: list of values} or nested {category: {subcategory: list of values}}
+        :return: Hierarchy
+        """
+        def leaves(node, path):
+            if isinstance(node, dict):
+                for key, child in node.items():
+                    yield from leaves(child, [key] + path)
+            else:
+                for value in node:
+                    yield [value] + path
+        return cls(list(leaves(hierarchy, [])))
+
+    @classmethod
+    def from_csv(cls, path, sep=";"):
+        """
+        Load an ARX hierarchy file: one row per value, value;level 1;...;top level
+        :return: Hierarchy
+        """
+        with open(path, newline="") as file:
+            return cls([row for row in csv.reader(file, delimiter=sep) if row])
+
+    def __nodes__(self, values):
+        """
+        Only the distinct values are looked up
+        :return: (code of the distinct value of each row, distinct values, (level, code) of each distinct value)
+        """
+        value_codes, uniques = pd.factorize(pd.Series(values).astype(str))
+        nodes = np.array([self.lookup.get(unique, (-1, -1)) for unique in uniques], dtype=np.int64).reshape(-1, 2)
+        return value_codes, uniques, nodes
+
+    def encode(self, values):
+        """
+        Level and code of the node of each value
+        :param values: Series with values or labels of any level
+        :return: (levels, codes) arrays, -1 for the values out of the hierarchy
+        """
+        value_codes, _, nodes = self.__nodes__(values)
+        return nodes[value_codes, 0], nodes[value_codes, 1]
+
+    def level_of(self, values):
+        """
+        :return: lowest level of the values in the hierarchy (0 if no value is in the hierarchy)
+        """
+        levels, _ = self.encode(values)
+        levels = levels[levels >= 0]
+        return int(levels.min()) if len(levels) else 0
+
+    def generalize(self, values, level):
+        """
+        Generalize the values to a level. The labels of a higher level are kept and the values out of the
+        hierarchy become "Other", except at the top level when it has a single label (such as "*"): then every
+        value becomes that label, so the top level merges every row. Level 0 returns the values unchanged.
+        :param values: Series with values or labels of any level
+        :return: array of labels
+        """
+        if level == 0:
+            return np.asarray(values, dtype=object).copy()
+        value_codes, uniques, nodes = self.__nodes__(values)
+        result = np.asarray(uniques, dtype=object).copy()
+        top = 1 < self.n_levels <= level + 1 and len(self.labels[-1]) == 1
+        result[nodes[:, 0] < 0] = self.labels[-1][0] if top else "Other"
+        for node_level in range(min(level, self.n_levels - 1)):
+            selected = nodes[:, 0] == node_level
+            codes = nodes[selected, 1]
+            for parents in self.parents[node_level:level]:
+                codes = parents[codes]
+            result[selected] = self.labels[min(level, self.n_levels - 1)][codes]
+        return result[value_codes]
+
+    def common_label(self, values):
+        """
+        :return: label of the lowest level shared by all the values, or None
+        """
+        levels, codes = self.encode(values)
+        if len(levels) == 0 or (levels < 0).any():
+            return None
+        for level in range(int(levels.max()), self.n_levels):
+            labels = set(self.generalize(pd.Series(values), level))
+            if len(labels) == 1:
+                return labels.pop()
+        return None
+
+
+def compile_hierarchies(categories_hierarchy):
+    """
+    Compile the hierarchy of each column
+    :param categories_hierarchy: {column: Hierarchy, dict of categories or path of an ARX hierarchy file}
+    :return: {column: Hierarchy}
+    """
+    if not isinstance(categories_hierarchy, dict):
+        return {}
+    hierarchies = {}
+    for col, hierarchy in categories_hierarchy.items():
+        if isinstance(hierarchy, Hierarchy):
+            hierarchies[col] = hierarchy
+        elif isinstance(hierarchy, dict):
+            hierarchies[col] = Hierarchy.from_dict(hierarchy)
+        elif isinstance(hierarchy, str):
+            hierarchies[col] = Hierarchy.from_csv(hierarchy)
+    return hierarchies
@@ -11,35 +11,259 @@ objective: apply a perturbation technique to the specified columns
 
 import numpy as np
 import pandas as pd
-pd.options.mode.chained_assignment = None  # default='warn'
 
-def perturbation_noise_addition(dataframe, col_index):
+# Distribution of the standard noise drawn by each noise technique
+NOISE_DISTRIBUTIONS = {
+    "perturbation_noise_addition": "normal",
+    "perturbation_gaussian": "normal",
+    "perturbation_laplace": "laplace",
+}
+
+
+def __generator__(rng):
+    """
+    :param rng: numpy Generator, or None for a new generator with a random seed
+    """
+    return rng if rng is not None else np.random.default_rng()
+
+
+def noise_matrix(rng, n_candidates, n_rows, distribution="normal"):
+    """
+    Standard noise of many candidates in a single draw
+    :param distribution: "normal" (mean 0, std 1) or "laplace" (mean 0, scale 1)
+    :return: array (n_candidates, n_rows)
+    """
+    rng = __generator__(rng)
+    if distribution == "normal":
+        return rng.standard_normal((n_candidates, n_rows))
+    if distribution == "laplace":
+        return rng.laplace(0.0, 1.0, (n_candidates, n_rows))
+    raise ValueError("Unknown noise distribution: %s" % distribution)
+
+
+def __add_noise__(dataframe, col_index, scale, distribution, rng, noise):
+    """
+    Add zero-mean noise to a column, the noise of an integer column is rounded to integers
+    :param noise: standard noise of each row, drawn from rng if None
+    """
     dfFinal = dataframe.copy(deep=True)
-    std = dfFinal[col_index].std(ddof=0)
-    mean = np.mean(dfFinal[col_index], axis=None)
-    if not std:
-        std = 1
-    noise = np.random.normal(mean, std, len(dfFinal[col_index])).astype(int)
+    if noise is None:
+        noise = noise_matrix(rng, 1, len(dfFinal), distribution)[0]
+    noise = np.asarray(noise) * scale
+    if pd.api.types.is_integer_dtype(dfFinal[col_index]):
+        noise = np.rint(noise).astype(np.int64)
     dfFinal[col_index] = dfFinal[col_index] + noise
     return dfFinal
 
 
-def perturbation_permutation(dataframe, col_index):
+def __sensitivity__(values, sensitivity):
+    """
+    :return: sensitivity, the range of the values if it is None
+    """
+    if sensitivity is None:
+        sensitivity = np.nanmax(values) - np.nanmin(values) if values.notna().any() else 0.0
+    return float(sensitivity)
+
+
+def perturbation_noise_addition(dataframe, col_index, rng=None, noise=None):
+    """
+    Add normal noise with mean 0 and the standard deviation of the column
+    :param rng: numpy Generator of the noise
+    :param noise: standard normal noise of each row, drawn from rng if None
+    """
+    std = dataframe[col_index].std(ddof=0)
+    if not std:
+        std = 1
+    return __add_noise__(dataframe, col_index, std, "normal", rng, noise)
+
+
+def perturbation_laplace(dataframe, col_index, epsilon, sensitivity=None, rng=None, noise=None):
+    """
+    Laplace mechanism, epsilon-differential privacy of each value: noise Laplace(0, sensitivity / epsilon)
+    :param sensitivity: maximum change of a value, the range of the column if None
+    :param noise: standard Laplace noise of each row, drawn from rng if None
+    """
+    if epsilon <= 0:
+        raise ValueError("epsilon must be positive")
+    scale = __sensitivity__(dataframe[col_index], sensitivity) / epsilon
+    return __add_noise__(dataframe, col_index, scale, "laplace", rng, noise)
+
+
+def perturbation_gaussian(dataframe, col_index, epsilon, delta=1e-5, sensitivity=None, rng=None, noise=None):
+    """
+    Gaussian mechanism, (epsilon, delta)-differential privacy of each value for epsilon < 1:
+    noise N(0, sigma^2) with sigma = sensitivity * sqrt(2 ln(1.25 / delta)) / epsilon
+    :param sensitivity: maximum change of a value, the range of the column if None
+    :param noise: standard normal noise of each row, drawn from rng if None
+    """
+    if epsilon <= 0 or not 0 < delta < 1:
+        raise ValueError("epsilon must be positive and delta between 0 and 1")
+    sigma = __sensitivity__(dataframe[col_index], sensitivity) * np.sqrt(2 * np.log(1.25 / delta)) / epsilon
+    return __add_noise__(dataframe, col_index, sigma, "normal", rng, noise)
+
+
+def perturbation_permutation(dataframe, col_index, rng=None):
     dfFinal = dataframe.copy(deep=True)
-    dfFinal[col_index] = np.random.permutation(dfFinal[col_index])
+    dfFinal[col_index] = __generator__(rng).permutation(dfFinal[col_index].to_numpy())
     return dfFinal
 
 
+def __group_size__(num_group, length):
+    """
+    :param num_group: fraction of the rows in each group if it is lower than 1, else number of rows of each group.
+    A fraction is rounded up, so a group never has fewer rows than the fraction asks.
+    """
+    size = int(np.ceil(num_group * length - 1e-9)) if num_group < 1 else int(num_group)
+    return max(size, 1)
+
+
+def __blocks__(length, size):
+    """
+    Block of each position of a sorted column: consecutive blocks of size rows, the last rows that can not
+    fill a block join the previous one, so every block has at least size rows
+    """
+    return np.minimum(np.arange(length) // size, max(length // size - 1, 0))
+
+
 def perturbation_micro_aggregation(dataframe, col_index, num_group):
     dfFinal = dataframe.copy(deep=True)
-    dfFinal = dfFinal.sort_values(by=col_index, ascending=True)
-    num_items_group = num_group * len(dfFinal.index)
-    i = 0
-    while i < len(dfFinal.index):
-        mean_subgroup = np.mean(dfFinal[col_index].tolist()[int(i): int(i + num_items_group)])
-        j = 0
-        while j < num_items_group:
-            dfFinal[col_index][j] = mean_subgroup
-            j += 1
-        i += num_items_group
+    values = dfFinal[col_index].to_numpy(dtype=np.float64)
+    # Missing values are kept and do not belong to any group
+    present = np.flatnonzero(~np.isnan(values))
+    order = present[np.argsort(values[present], kind="stable")]
+    blocks = __blocks__(len(order), __group_size__(num_group, len(order)))
+    means = np.bincount(blocks, weights=values[order]) / np.maximum(np.bincount(blocks), 1)
+    aggregated = values.copy()
+    aggregated[order] = means[blocks]
+    dfFinal[col_index] = aggregated
     return dfFinal
+
+
+def micro_aggregation_bins(values, num_group):
+    """
+    Blocks of perturbation_micro_aggregation as bins, to aggregate other values of the same column with them
+    :return: (last value of each block but the last one, mean of each block)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    present = np.sort(values[~np.isnan(values)])
+    blocks = __blocks__(len(present), __group_size__(num_group, len(present)))
+    means = np.bincount(blocks, weights=present) / np.maximum(np.bincount(blocks), 1)
+    return present[np.flatnonzero(np.diff(blocks))], means
+
+
+def mdav_groups(points, k, chunk_size=None):
+    """
+    Groups of the Maximum Distance to Average Vector (MDAV) method: at each step the record farthest from the
+    centroid of the remaining records and the record farthest from it form a group with their k - 1 nearest
+    records. Every group has between k and 2k - 1 records. Each step is a few matrix-vector products over the
+    remaining records, so the whole method is O(n^2 / k).
+    :param points: array (rows, columns) with the standardized values
+    :param chunk_size: if given, the records are sorted along their first principal axis and MDAV runs on
+    consecutive chunks of at least chunk_size records, O(n * chunk_size / k)
+    :return: array with the group id of each row
+    """
+    length = len(points)
+    if chunk_size is not None and length > max(chunk_size, 2 * k):
+        centered = points - points.mean(axis=0)
+        axis = np.linalg.eigh(centered.T @ centered)[1][:, -1]
+        order = np.argsort(centered @ axis, kind="stable")
+        chunks = __blocks__(length, max(int(chunk_size), int(k)))
+        group_ids = np.empty(length, dtype=np.int64)
+        offset = 0
+        for chunk in np.split(order, np.flatnonzero(np.diff(chunks)) + 1):
+            chunk_ids = mdav_groups(points[chunk], k)
+            group_ids[chunk] = chunk_ids + offset
+            offset += chunk_ids.max() + 1
+        return group_ids
+
+    group_ids = np.full(length, -1, dtype=np.int64)
+    k = max(min(int(k), length), 1)
+    rows = np.arange(length)  # rows of the remaining records
+    points = np.asarray(points, dtype=np.float64)
+    norms = (points ** 2).sum(axis=1)
+    alive = np.ones(length, dtype=bool)
+    total = points.sum(axis=0)
+    n_alive = length
+    group = 0
+
+    def distances(center, dead):
+        # Squared distances to center, dead is the value of the records already grouped
+        result = norms - 2 * (points @ center) + center @ center
+        result[~alive] = dead
+        return result
+
+    def assign(selected):
+        nonlocal group, total, n_alive
+        group_ids[rows[selected]] = group
+        group += 1
+        alive[selected] = False
+        total = total - points[selected].sum(axis=0)
+        n_alive -= len(selected)
+
+    def nearest(center):
+        result = distances(center, np.inf)
+        if n_alive <= k:
+            return np.flatnonzero(alive)
+        return np.argpartition(result, k - 1)[:k]
+
+    while n_alive >= 3 * k:
+        if n_alive < len(rows) // 2:
+            # Compact the arrays so the passes only visit the remaining records
+            rows, points, norms = rows[alive], points[alive], norms[alive]
+            alive = np.ones(len(rows), dtype=bool)
+        farthest = points[np.argmax(distances(total / n_alive, -np.inf))].copy()
+        selected = nearest(farthest)
+        opposite = points[np.argmax(distances(farthest, -np.inf))].copy()
+        assign(selected)
+        assign(nearest(opposite))
+    if n_alive >= 2 * k:
+        assign(nearest(points[np.argmax(distances(total / n_alive, -np.inf))].copy()))
+    if n_alive:
+        assign(np.flatnonzero(alive))
+    return group_ids
+
+
+def __standardize__(values):
+    """
+    Standardize each column, missing values become the mean
+    """
+    mean = np.nanmean(values, axis=0) if len(values) else np.zeros(values.shape[1])
+    std = np.nanstd(values, axis=0) if len(values) else np.ones(values.shape[1])
+    std[~(std > 0)] = 1
+    standardized = (values - mean) / std
+    standardized[np.isnan(standardized)] = 0
+    return standardized
+
+
+def perturbation_mdav(dataframe, col_indexes, k, chunk_size=None):
+    """
+    Multivariate micro-aggregation (MDAV) of several columns: the records are grouped in groups of at least k
+    close records over all the columns, and the columns of each record are replaced by the centroid of its group
+    :param chunk_size: run MDAV on chunks of records along the first principal axis (see mdav_groups)
+    """
+    dfFinal = dataframe.copy(deep=True)
+    values = dfFinal[col_indexes].to_numpy(dtype=np.float64)
+    group_ids = mdav_groups(__standardize__(values), k, chunk_size)
+    n_groups = group_ids.max() + 1 if len(group_ids) else 0
+    for i, col in enumerate(col_indexes):
+        present = ~np.isnan(values[:, i])
+        sums = np.bincount(group_ids[present], weights=values[present, i], minlength=n_groups)
+        counts = np.bincount(group_ids[present], minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dfFinal[col] = (sums / counts)[group_ids]
+    return dfFinal
+
+
+def information_loss(original, aggregated):
+    """
+    Information loss of a micro-aggregation, SSE / SST averaged over the columns
+    :param original: array (rows, columns) with the original values
+    :param aggregated: array (rows, columns) with the aggregated values
+    :return: float between 0 and 1
+    """
+    original = np.asarray(original, dtype=np.float64)
+    aggregated = np.asarray(aggregated, dtype=np.float64)
+    sse = np.nansum((original - aggregated) ** 2, axis=0)
+    sst = np.nansum((original - np.nanmean(original, axis=0)) ** 2, axis=0) if len(original) else sse
+    losses = np.where(sst > 0, sse / np.where(sst > 0, sst, 1), 0.0)
+    return float(losses.mean()) if len(losses) else 0.0
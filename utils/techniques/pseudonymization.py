@@ -1,16 +1,27 @@
-import random
 import pandas as pd
-import random
+import numpy as np
 import hmac
 import hashlib
+import json
+import os
+import base64
+import sqlite3
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESSIV
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
 ################################################################################
 # FUNCTIONS TO SUBSTITUTE IDENTIFIERS WITH A REVERSIBLE AND SECURE PSEUDONYM   #
 #########################################################################################
 # TECHNIQUES BASED ON Guidelines on shaping technology according to GDPR provisions.pdf #
 #########################################################################################
-from utils.techniques.generateKeys import load_secret_key, load_encription_key
+from utils.techniques.generateKeys import default_key_manager
+
+# Suffix of the column with the id of the key of each pseudonym
+KEY_ID_SUFFIX = "_key_id"
 
 """
 input dataframe: dataset origen
@@ -20,108 +31,345 @@ objective: apply a pseudonymous technique to the specified identifiers columns
 """
 
 
-def pseudonymization_counter(dataframe, identifier):
+def __pseudonym_codes__(values, unique):
+    """
+    :param unique: one pseudonym per distinct value instead of one per row
+    :return: (code of the pseudonym of each row, original value of each code)
+    """
+    if not unique:
+        return np.arange(len(values)), np.asarray(values, dtype=object)
+    codes, uniques = pd.factorize(values)
+    origins = np.asarray(uniques, dtype=object)
+    if (codes < 0).any():
+        # The missing values share one more pseudonym
+        codes = np.where(codes < 0, len(origins), codes)
+        origins = np.append(origins, values[pd.isna(values)].iloc[0])
+    return codes, origins
+
+
+def pseudonymization_counter(dataframe, identifier, unique=False, rng=None):
     """
     Counter is the simplest pseudonymous function. The identifiers are substituted by a number
      chosen by a monotonic counter. First, a seed 𝑠 is set to 0 (for instance) and then it is incremented.
      It is critical that the values produced by the counter never repeat to prevent any ambiguity.
+    :param unique: repeated identifiers share one pseudonym
+    :param rng: numpy Generator of the shuffle of the rows (None for a generator seeded by the system)
     """
-    dfFinal = dataframe.copy(deep=True)
-    dfFinal = dfFinal.sample(frac=1).reset_index(drop=True)  # Shuffle rows
-    mapping_table = {
-        "origen": [],
-        "final": []
-    }
-    counter = 1
-    for index, row in dfFinal.iterrows():
-        mapping_table["origen"].append(dfFinal[identifier][index])
-        dfFinal.at[index, identifier] = counter
-        mapping_table["final"].append(counter)
-        counter += 1
-    dfMapping = pd.DataFrame(mapping_table)
+    rng = rng if rng is not None else np.random.default_rng()
+    # Shuffle rows
+    dfFinal = dataframe.iloc[rng.permutation(len(dataframe))].reset_index(drop=True)
+    codes, origins = __pseudonym_codes__(dfFinal[identifier], unique)
+    pseudonyms = np.arange(1, len(origins) + 1)
+    dfFinal[identifier] = pseudonyms[codes]
+    dfMapping = pd.DataFrame({"origen": origins, "final": pseudonyms})
     return dfFinal, dfMapping
 
 
-def pseudonymization_rng(dataframe, identifier):
+def pseudonymization_rng(dataframe, identifier, unique=False, rng=None):
     """
     Two options are available to create this mapping: a true random number generator or a cryptographic pseudo-random
     generator. It should be noted that in both cases, without due care, collisions can occur.
+    The pseudonyms are drawn without replacement from 1..3n in a single draw, so they never collide.
+    :param unique: repeated identifiers share one pseudonym
+    :param rng: numpy Generator (None for a generator seeded by the system)
     """
     dfFinal = dataframe.copy(deep=True)
-    random.seed()
-    limit = len(dfFinal) * 3  # Multiply for 3 to avoid a big number of collisions
-    mapping_table = {
-        "origen": [],
-        "final": []
-    }
-    for index, row in dfFinal.iterrows():
-        mapping_table["origen"].append(dfFinal[identifier][index])
-        pseudo_number = random.randint(1, limit)
-        dfFinal.at[index, identifier] = pseudo_number
-        mapping_table["final"].append(pseudo_number)
-    dfMapping = pd.DataFrame(mapping_table)
+    rng = rng if rng is not None else np.random.default_rng()
+    codes, origins = __pseudonym_codes__(dfFinal[identifier], unique)
+    limit = len(origins) * 3  # Multiply for 3 to keep the pseudonyms hard to guess
+    pseudonyms = rng.choice(limit, size=len(origins), replace=False) + 1
+    dfFinal[identifier] = pseudonyms[codes]
+    dfMapping = pd.DataFrame({"origen": origins, "final": pseudonyms})
     return dfFinal, dfMapping
 
 
-def pseudonymization_hmac(dataframe, identifier):
+class DigestCache:
+    def __init__(self, path=None):
+        """
+        Digests of the values already pseudonymized with HMAC, {value: digest}, to reuse them across loads.
+        The cache maps identifiers to their pseudonyms: it has to be protected as a mapping table.
+        :param path: JSON file where the cache is kept (None to keep it only in memory)
+        """
+        self.path = path
+        self.key_id = None
+        self.digests = {}
+        self.changed = False
+
+    def bind(self, secret_key):
+        """
+        Use the digests of a secret key: the cache is loaded from its file, and it is emptied if it was made
+        with another key
+        """
+        key_id = hmac.new(secret_key, b"digest cache", hashlib.sha256).hexdigest()
+        if key_id == self.key_id:
+            return
+        self.key_id = key_id
+        self.digests = {}
+        self.changed = False
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path) as file:
+                content = json.load(file)
+            if content.get("key_id") == key_id:
+                self.digests = content["digests"]
+
+    def save(self):
+        """
+        Write the cache to its file if it has new digests
+        """
+        if self.path is None or not self.changed:
+            return
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump({"key_id": self.key_id, "digests": self.digests}, file)
+        os.replace(temporary, self.path)
+        self.changed = False
+
+
+def hmac_digests(values, secret_key, cache=None):
+    """
+    HMAC-SHA256 of each value, with a fresh HMAC for each value so the pseudonym of a value never depends on
+    the other rows. The digest is computed once per distinct value and scattered back to the rows.
+    :param values: Series
+    :param cache: DigestCache with the digests already known
+    :return: array with the hex digest of each value
+    """
+    codes, uniques = pd.factorize(values)
+    # The code of the missing values is -1, the last message
+    messages = [str(value) for value in uniques] + [str(np.nan)]
+    digest_maker = hmac.new(secret_key, b'', hashlib.sha256)
+    if cache is not None:
+        cache.bind(secret_key)
+    digests = np.empty(len(messages), dtype=object)
+    for i, msg in enumerate(messages):
+        digest = cache.digests.get(msg) if cache is not None else None
+        if digest is None:
+            # Copying the keyed HMAC skips the key setup of every value
+            value_digest = digest_maker.copy()
+            value_digest.update(msg.encode())
+            digest = value_digest.hexdigest()
+            if cache is not None:
+                cache.digests[msg] = digest
+                cache.changed = True
+        digests[i] = digest
+    if cache is not None:
+        cache.save()
+    return digests[codes]
+
+
+def __store_key_id__(dfFinal, identifier, key_id):
+    """
+    Write the id of the key in the column next to the pseudonyms
+    """
+    column = identifier + KEY_ID_SUFFIX
+    if column in dfFinal:
+        dfFinal[column] = key_id
+    else:
+        dfFinal.insert(dfFinal.columns.get_loc(identifier) + 1, column, key_id)
+
+
+def __key_groups__(dfFinal, identifier, keys, kind):
+    """
+    Rows pseudonymized with each key: the ids of the key id column, or the current key if there is no such column
+    :return: list of (Boolean array with the rows, key)
+    """
+    column = identifier + KEY_ID_SUFFIX
+    if column not in dfFinal:
+        return [(np.ones(len(dfFinal), dtype=bool), keys.key(kind))]
+    return [((dfFinal[column] == key_id).to_numpy(), keys.key(kind, key_id))
+            for key_id in pd.unique(dfFinal[column])]
+
+
+def pseudonymization_hmac(dataframe, identifier, cache=None, keys=None, store_key_id=False):
     """
     MAC is generally considered as a robust pseudonymisation technique from a data protection point of view, since
     reverting the pseudonym is infeasible, as long as the key has not be compromised.
+    The same identifier always gets the same pseudonym, so the pseudonyms of different files can be joined.
+    :param cache: DigestCache with the digests of the previous loads
+    :param keys: KeyManager with the secret key (None for the KeyManager of the process)
+    :param store_key_id: write the id of the current key in the column <identifier>_key_id
     """
-    secret_key = load_secret_key()
-    digest_maker = hmac.new(secret_key, b'', hashlib.sha256)
+    keys = keys if keys is not None else default_key_manager()
+    key_id = keys.current_id("secret")
     dfFinal = dataframe.copy(deep=True)
-    for index, row in dfFinal.iterrows():
-        msg = str(row[identifier])
-        msg_bytes = msg.encode()
-        digest_maker.update(msg_bytes)
-        dfFinal.at[index, identifier] = digest_maker.hexdigest()
+    dfFinal[identifier] = hmac_digests(dfFinal[identifier], keys.key("secret", key_id), cache)
+    if store_key_id:
+        __store_key_id__(dfFinal, identifier, key_id)
     return dfFinal
 
 
-def pseudonymization_encryption(dataframe, identifier):
+# Ciphers of the process, built once per key by each worker of the pool
+__ciphers__ = {}
+
+
+def __siv_key__(encription_key):
+    """
+    AES-SIV key (512 bits) derived from the Fernet key, so the deterministic encryption needs no other key file
+    """
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=64, salt=None, info=b"pseudonymization aes-siv")
+    return hkdf.derive(base64.urlsafe_b64decode(encription_key))
+
+
+def __cipher__(encription_key, deterministic):
+    if (encription_key, deterministic) not in __ciphers__:
+        __ciphers__[(encription_key, deterministic)] = \
+            AESSIV(__siv_key__(encription_key)) if deterministic else Fernet(encription_key)
+    return __ciphers__[(encription_key, deterministic)]
+
+
+def __encrypt_messages__(messages, deterministic, encription_key):
+    cipher = __cipher__(encription_key, deterministic)
+    if deterministic:
+        return [base64.urlsafe_b64encode(cipher.encrypt(msg.encode(), None)).decode() for msg in messages]
+    return [cipher.encrypt(msg.encode()).decode() for msg in messages]
+
+
+def __decrypt_messages__(messages, deterministic, encription_key):
+    cipher = __cipher__(encription_key, deterministic)
+    if deterministic:
+        return [cipher.decrypt(base64.urlsafe_b64decode(msg.encode()), None).decode() for msg in messages]
+    return [cipher.decrypt(msg.encode()).decode() for msg in messages]
+
+
+def __map_messages__(function, messages, deterministic, encription_key, workers, chunk_size):
+    """
+    Apply function to the messages, in chunks of chunk_size messages in a process pool if workers > 1.
+    The key is sent with the tasks, so the workers never read the key files.
+    :return: list with the result of each message
+    """
+    if workers is None or workers <= 1 or len(messages) <= chunk_size:
+        return function(messages, deterministic, encription_key)
+    chunks = [messages[i:i + chunk_size] for i in range(0, len(messages), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(function, chunks, repeat(deterministic), repeat(encription_key))
+        return [result for chunk in results for result in chunk]
+
+
+def __messages__(values):
+    """
+    Message of each value. Every missing value (None, NaN, NaT) is the message "nan" for both ciphers.
+    """
+    messages = [str(value) for value in values]
+    for i in np.flatnonzero(pd.isna(np.asarray(values, dtype=object))):
+        messages[i] = str(np.nan)
+    return messages
+
+
+def __transform_column__(values, function, deterministic, encription_key, workers, chunk_size):
+    """
+    The deterministic cipher handles each distinct value once and scatters the results back, Fernet every row
+    """
+    if not deterministic:
+        return __map_messages__(function, __messages__(values), deterministic, encription_key, workers, chunk_size)
+    codes, uniques = pd.factorize(values)
+    messages = __messages__(uniques)
+    if (codes < 0).any():
+        # The code of the missing values is -1, the last message
+        messages.append(str(np.nan))
+    results = np.array(__map_messages__(function, messages, deterministic, encription_key, workers, chunk_size),
+                       dtype=object)
+    return results[codes]
+
+
+def pseudonymization_encryption(dataframe, identifier, deterministic=False, workers=None, chunk_size=100000,
+                                keys=None, store_key_id=False):
     """
     Fernet guarantees that a message encrypted using it cannot be manipulated or read without the key.
     Fernet is an implementation of symmetric (also known as “secret key”) authenticated cryptography.
+    :param deterministic: encrypt with AES-SIV instead of Fernet: equal identifiers get equal ciphertexts, so
+    they can still be joined, and each distinct identifier is encrypted once
+    :param workers: number of processes (None or 1 to encrypt in this process), each one builds the cipher once
+    :param chunk_size: identifiers encrypted by each task of the pool
+    :param keys: KeyManager with the encryption key (None for the KeyManager of the process)
+    :param store_key_id: write the id of the current key in the column <identifier>_key_id
     """
-    encription_key = load_encription_key()
-    fernet = Fernet(encription_key)
+    keys = keys if keys is not None else default_key_manager()
+    key_id = keys.current_id("encryption")
     dfFinal = dataframe.copy(deep=True)
-    for index, row in dfFinal.iterrows():
-        msg = str(row[identifier])
-        msg_bytes = msg.encode()
-        encMsg = fernet.encrypt(msg_bytes)
-        dfFinal.at[index, identifier] = encMsg.decode()
+    dfFinal[identifier] = __transform_column__(dfFinal[identifier], __encrypt_messages__, deterministic,
+                                               keys.key("encryption", key_id), workers, chunk_size)
+    if store_key_id:
+        __store_key_id__(dfFinal, identifier, key_id)
     return dfFinal
 
 
-def revert_pseudonymization_with_mapping_table(dfFinal, dfMapping, identifier):
+def save_mapping_table(dfMapping, path):
+    """
+    Add a mapping table to an on-disk SQLite table indexed by the pseudonym, so a subset of pseudonyms can be
+    reverted without loading the whole table. A pseudonym already in the table gets its new origin.
+    """
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS mapping (final PRIMARY KEY, origen)")
+        connection.executemany("INSERT OR REPLACE INTO mapping (final, origen) VALUES (?, ?)",
+                               zip(dfMapping["final"].tolist(), dfMapping["origen"].tolist()))
+    connection.close()
+
+
+def load_mapping_table(path, pseudonyms=None):
+    """
+    :param pseudonyms: pseudonyms to look up in the on-disk mapping table (None to load the whole table)
+    :return: Dataframe with the columns origen and final
+    """
+    with sqlite3.connect(path) as connection:
+        if pseudonyms is None:
+            rows = connection.execute("SELECT origen, final FROM mapping").fetchall()
+        else:
+            connection.execute("CREATE TEMP TABLE wanted (final PRIMARY KEY)")
+            connection.executemany("INSERT OR IGNORE INTO wanted (final) VALUES (?)",
+                                   ((pseudonym,) for pseudonym in pd.unique(pd.Series(pseudonyms)).tolist()))
+            rows = connection.execute("SELECT mapping.origen, mapping.final FROM mapping "
+                                      "JOIN wanted ON mapping.final = wanted.final").fetchall()
+    connection.close()
+    return pd.DataFrame(rows, columns=["origen", "final"])
+
+
+def __revert_with_mapping__(dfFinal, identifier, origins, pseudonyms):
+    """
+    Revert the pseudonyms with a single hash join, the values without origin are kept
+    """
     dfReversible = dfFinal.copy(deep=True)
-    for index, row in dfMapping.iterrows():
-        dfReversible.loc[dfReversible[identifier] == row["final"], identifier] = row["origen"]
+    mapping = pd.Series(np.asarray(origins, dtype=object), index=pd.Index(pseudonyms))
+    # The last origin of a repeated pseudonym wins
+    mapping = mapping[~mapping.index.duplicated(keep="last")]
+    values = dfReversible[identifier]
+    reverted = values.map(mapping)
+    dfReversible[identifier] = reverted.where(values.isin(mapping.index), values)
     return dfReversible
 
 
-def revert_pseudonymization_hmac(dfOrigen, dfFinal, identifier):
-    secret_key = load_secret_key()
-    digest_maker = hmac.new(secret_key, b'', hashlib.sha256)
+def revert_pseudonymization_with_mapping_table(dfFinal, dfMapping, identifier):
+    """
+    :param dfMapping: mapping table, or path of an on-disk mapping table: only the pseudonyms of dfFinal are read
+    """
+    if isinstance(dfMapping, str):
+        dfMapping = load_mapping_table(dfMapping, dfFinal[identifier])
+    return __revert_with_mapping__(dfFinal, identifier, dfMapping["origen"], dfMapping["final"])
+
+
+def revert_pseudonymization_hmac(dfOrigen, dfFinal, identifier, keys=None):
+    """
+    :param keys: KeyManager with the secret keys (None for the KeyManager of the process). The rows are reverted
+    with the key of the column <identifier>_key_id if it exists, else with the current key.
+    """
+    keys = keys if keys is not None else default_key_manager()
+    origins = dfOrigen[identifier].drop_duplicates()
     dfReversible = dfFinal.copy(deep=True)
-    for index, row in dfOrigen.iterrows():
-        msg = str(row[identifier])
-        msg_bytes = msg.encode()
-        digest_maker.update(msg_bytes)
-        digest = digest_maker.hexdigest()
-        dfReversible.loc[dfReversible[identifier] == digest, identifier] = row[identifier]
-    return dfReversible
+    for rows, secret_key in __key_groups__(dfFinal, identifier, keys, "secret"):
+        reverted = __revert_with_mapping__(dfFinal[rows], identifier, origins, hmac_digests(origins, secret_key))
+        dfReversible.loc[rows, identifier] = reverted[identifier].values
+    return dfReversible.drop(columns=[identifier + KEY_ID_SUFFIX], errors="ignore")
 
 
-def revert_pseudonymization_encryption(dfFinal, identifier):
-    key = load_encription_key()
-    fernet = Fernet(key)
+def revert_pseudonymization_encryption(dfFinal, identifier, deterministic=False, workers=None, chunk_size=100000,
+                                       keys=None):
+    """
+    :param deterministic: the identifiers were encrypted with deterministic=True
+    :param workers: number of processes (None or 1 to decrypt in this process)
+    :param keys: KeyManager with the encryption keys (None for the KeyManager of the process). The rows are
+    decrypted with the key of the column <identifier>_key_id if it exists, else with the current key.
+    """
+    keys = keys if keys is not None else default_key_manager()
     dfReversible = dfFinal.copy(deep=True)
-    for index, row in dfReversible.iterrows():
-        msg = str(row[identifier])
-        msg_bytes = msg.encode()
-        decMsg = fernet.decrypt(msg_bytes)
-        dfReversible.at[index, identifier] = decMsg.decode()
-    return dfReversible
+    for rows, encription_key in __key_groups__(dfFinal, identifier, keys, "encryption"):
+        dfReversible.loc[rows, identifier] = __transform_column__(dfFinal.loc[rows, identifier], __decrypt_messages__,
+                                                                  deterministic, encription_key, workers, chunk_size)
+    return dfReversible.drop(columns=[identifier + KEY_ID_SUFFIX], errors="ignore")